@@ -0,0 +1,169 @@
+from pathlib import Path
+import json
+import os
+import threading
+from hashlib import sha256
+
+# bump when the stored fields change so old cache files get ignored
+CACHE_VERSION = 1
+
+def fileHash(path,chunksize=1024*1024):
+	h = sha256()
+	with open(path,'rb') as f:
+		for chunk in iter(lambda: f.read(chunksize),b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+# (size, mtime) or None when the file is missing
+def fileStat(path):
+	try:
+		st = os.stat(path)
+	except OSError:
+		return None
+	return (st.st_size,st.st_mtime_ns)
+
+# size plus the first and last blocks, files that differ here cannot be identical
+# and files that match are hashed in full to be sure
+def partialHash(path,blocksize=64*1024):
+	h = sha256()
+	size = os.path.getsize(path)
+	h.update(str(size).encode())
+	with open(path,'rb') as f:
+		h.update(f.read(blocksize))
+		if size > 2*blocksize:
+			f.seek(-blocksize,os.SEEK_END)
+			h.update(f.read(blocksize))
+	return h.hexdigest()
+
+# apk metadata kept on disk so unchanged apks are never probed again
+# entries are keyed by absolute path and trusted while size and mtime match,
+# otherwise the content hash is used to find a moved or touched copy
+class ApkCache:
+	fields = ('name','version','title')
+
+	def __init__(self,cacheFile:Path):
+		self.cacheFile = Path(cacheFile)
+		self.lock = threading.Lock()
+		self.load()
+
+	def load(self):
+		self.entries = {}
+		self.hashes = {}
+		self.dirty = False
+		if self.cacheFile.exists():
+			try:
+				data = json.loads(self.cacheFile.read_text(encoding='utf-8'))
+				if data.get('version') == CACHE_VERSION:
+					self.entries = data['entries']
+			except (ValueError,KeyError):
+				self.entries = {}
+		self.reindex()
+
+	# hash -> path of an entry with that content, preferring entries that already hold metadata
+	def reindex(self):
+		self.hashes = {}
+		for key,entry in self.entries.items():
+			self._index(key,entry)
+
+	def _index(self,key,entry):
+		if entry.get('hash'):
+			current = self.entries.get(self.hashes.get(entry['hash']))
+			if current is None or 'name' not in current or 'name' in entry:
+				self.hashes[entry['hash']] = key
+
+	def save(self):
+		with self.lock:
+			if not self.dirty: return
+			data = json.dumps({'version':CACHE_VERSION,'entries':self.entries})
+			self.dirty = False
+		self.cacheFile.parent.mkdir(parents=True,exist_ok=True)
+		tmp = self.cacheFile.with_suffix('.tmp')
+		tmp.write_text(data,encoding='utf-8')
+		os.replace(tmp,self.cacheFile)
+
+	@staticmethod
+	def key(apkpath):
+		return Path(apkpath).absolute().as_posix()
+
+	def _stat(self,apkpath):
+		stat = os.stat(apkpath)
+		return {'size':stat.st_size,'mtime':stat.st_mtime_ns}
+
+	def _set(self,key,entry):
+		old = self.entries.get(key) or {}
+		self.entries[key] = entry
+		if old.get('hash') and old['hash'] != entry.get('hash') and self.hashes.get(old['hash']) == key:
+			self.reindex()
+		else:
+			self._index(key,entry)
+		self.dirty = True
+
+	# content hash of the apk, only read from disk when size or mtime changed
+	def hash(self,apkpath):
+		key = self.key(apkpath)
+		stat = self._stat(apkpath)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry and entry.get('hash') and entry['size'] == stat['size'] and entry['mtime'] == stat['mtime']:
+				return entry['hash']
+		digest = fileHash(apkpath)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry and entry.get('hash') != digest:
+				entry = None
+			self._set(key,(entry or {}) | stat | {'hash':digest})
+		return digest
+
+	# returns the cached name, version and title or None when the apk has to be probed
+	def get(self,apkpath):
+		key = self.key(apkpath)
+		stat = self._stat(apkpath)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry and entry['size'] == stat['size'] and entry['mtime'] == stat['mtime'] and 'name' in entry:
+				return {x:entry[x] for x in self.fields}
+		digest = self.hash(apkpath)
+		with self.lock:
+			match = self.entries.get(self.hashes.get(digest))
+			if match is None or 'name' not in match:
+				return None
+			self._set(key,self.entries.get(key,{}) | {x:match[x] for x in self.fields})
+			return {x:match[x] for x in self.fields}
+
+	def put(self,apkpath,apk):
+		digest = self.hash(apkpath)
+		key = self.key(apkpath)
+		with self.lock:
+			self._set(key,self.entries[key] | {x:getattr(apk,x) for x in self.fields} | {'hash':digest})
+
+	# keeps the entry when an apk is renamed, e.g. by Apk.normalizeName
+	def move(self,old,new):
+		old,new = self.key(old),self.key(new)
+		with self.lock:
+			if old in self.entries:
+				self._set(new,self.entries.pop(old))
+
+	def invalidate(self,apkpath):
+		key = self.key(apkpath)
+		with self.lock:
+			if self.entries.pop(key,None) is not None:
+				self.reindex()
+				self.dirty = True
+
+	# drops entries of apks that no longer exist
+	def prune(self):
+		with self.lock:
+			missing = [x for x in self.entries if not Path(x).exists()]
+			for key in missing:
+				del self.entries[key]
+			if missing:
+				self.reindex()
+				self.dirty = True
+		self.save()
+
+	def purge(self):
+		with self.lock:
+			self.entries = {}
+			self.hashes = {}
+			self.dirty = False
+		self.cacheFile.unlink(missing_ok=True)
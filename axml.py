@@ -0,0 +1,216 @@
+from pathlib import Path
+import struct
+import zipfile
+from validation import Apk
+
+# reads package, versionName and label straight out of an apk without aapt
+# only AndroidManifest.xml and resources.arsc are read from the zip, nothing gets extracted
+
+# chunk types from frameworks/base/libs/androidfw/include/androidfw/ResourceTypes.h
+RES_STRING_POOL_TYPE = 0x0001
+RES_TABLE_TYPE = 0x0002
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+
+NO_ENTRY = 0xFFFFFFFF
+UTF8_FLAG = 0x100
+FLAG_COMPLEX = 0x0001
+FLAG_COMPACT = 0x0008
+FLAG_SPARSE = 0x01
+FLAG_OFFSET16 = 0x02
+
+ATTR_LABEL = 0x01010001
+ATTR_VERSIONNAME = 0x0101021c
+
+class AxmlError(Exception):
+	pass
+
+def chunks(data,start,end):
+	while start + 8 <= end:
+		ctype, hsize, size = struct.unpack_from('<HHI',data,start)
+		if size < 8 or start + size > end:
+			raise AxmlError(f'Bad chunk 0x{ctype:04x} at {start}')
+		yield ctype, hsize, start, size
+		start += size
+
+def _length8(data,pos):
+	n = data[pos]
+	if n & 0x80:
+		return ((n & 0x7f) << 8) | data[pos+1], pos+2
+	return n, pos+1
+
+def _length16(data,pos):
+	n = struct.unpack_from('<H',data,pos)[0]
+	if n & 0x8000:
+		return ((n & 0x7fff) << 16) | struct.unpack_from('<H',data,pos+2)[0], pos+4
+	return n, pos+2
+
+# strings are decoded when asked for, a resources.arsc pool can hold tens of thousands
+class StringPool:
+	def __init__(self,data,start):
+		_, _, _, count, _, flags, stringsStart, _ = struct.unpack_from('<HHIIIIII',data,start)
+		self.data = data
+		self.utf8 = bool(flags & UTF8_FLAG)
+		self.offsets = struct.unpack_from(f'<{count}I',data,start+28)
+		self.base = start + stringsStart
+		self.cache = {}
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def __getitem__(self,index):
+		if index in self.cache:
+			return self.cache[index]
+		if index < 0 or index >= len(self.offsets):
+			return None
+		pos = self.base + self.offsets[index]
+		if self.utf8:
+			_, pos = _length8(self.data,pos)
+			size, pos = _length8(self.data,pos)
+			value = self.data[pos:pos+size].decode('utf-8',errors='replace')
+		else:
+			size, pos = _length16(self.data,pos)
+			value = self.data[pos:pos+size*2].decode('utf-16-le',errors='replace')
+		self.cache[index] = value
+		return value
+
+# (type, data) pairs for the attributes of the manifest and application elements
+def parseManifest(data):
+	ctype, hsize, size = struct.unpack_from('<HHI',data,0)
+	if ctype != RES_XML_TYPE:
+		raise AxmlError('AndroidManifest.xml is not binary xml')
+	strings = None
+	resmap = ()
+	elements = {}
+	for ctype, hsize, start, csize in chunks(data,hsize,min(size,len(data))):
+		if ctype == RES_STRING_POOL_TYPE:
+			strings = StringPool(data,start)
+		elif ctype == RES_XML_RESOURCE_MAP_TYPE:
+			resmap = struct.unpack_from(f'<{(csize-hsize)//4}I',data,start+hsize)
+		elif ctype == RES_XML_START_ELEMENT_TYPE:
+			_, name, attrStart, attrSize, attrCount = struct.unpack_from('<IIHHH',data,start+hsize)
+			tag = strings[name]
+			if tag not in ('manifest','application') or tag in elements:
+				continue
+			attrs = {}
+			for i in range(attrCount):
+				pos = start + hsize + attrStart + i*attrSize
+				_, aname, raw, _, _, dtype, value = struct.unpack_from('<IIIHBBI',data,pos)
+				key = resmap[aname] if aname < len(resmap) and resmap[aname] else strings[aname]
+				if dtype == TYPE_STRING:
+					attrs[key] = (TYPE_STRING,strings[value if raw == NO_ENTRY else raw])
+				else:
+					attrs[key] = (dtype,value)
+			elements[tag] = attrs
+			if len(elements) == 2:
+				break
+	return elements
+
+class ResourceTable:
+	def __init__(self,data):
+		self.data = data
+		ctype, hsize, size = struct.unpack_from('<HHI',data,0)
+		if ctype != RES_TABLE_TYPE:
+			raise AxmlError('resources.arsc is not a resource table')
+		self.strings = None
+		self.packages = {}
+		for ctype, chsize, start, csize in chunks(data,hsize,min(size,len(data))):
+			if ctype == RES_STRING_POOL_TYPE:
+				self.strings = StringPool(data,start)
+			elif ctype == RES_TABLE_PACKAGE_TYPE:
+				self.packages[struct.unpack_from('<I',data,start+8)[0]] = (chsize,start,csize)
+
+	# every value stored for resid, one per configuration, as (config, type, data)
+	def values(self,resid):
+		pkg = self.packages.get(resid >> 24)
+		if pkg is None:
+			return
+		phsize, pstart, psize = pkg
+		typeid, entry = (resid >> 16) & 0xff, resid & 0xffff
+		for ctype, hsize, start, csize in chunks(self.data,pstart+phsize,pstart+psize):
+			if ctype != RES_TABLE_TYPE_TYPE:
+				continue
+			tid, flags, _, count, entriesStart = struct.unpack_from('<BBHII',self.data,start+8)
+			if tid != typeid:
+				continue
+			config = self.data[start+20:start+hsize]
+			offset = self._entryOffset(start+hsize,flags,count,entry)
+			if offset is None:
+				continue
+			pos = start + entriesStart + offset
+			esize, eflags = struct.unpack_from('<HH',self.data,pos)
+			if eflags & FLAG_COMPACT:
+				yield config, eflags >> 8, struct.unpack_from('<I',self.data,pos+4)[0]
+			elif not eflags & FLAG_COMPLEX:
+				_, _, dtype, value = struct.unpack_from('<HBBI',self.data,pos+esize)
+				yield config, dtype, value
+
+	def _entryOffset(self,pos,flags,count,entry):
+		if flags & FLAG_SPARSE:
+			for i in range(count):
+				idx, offset = struct.unpack_from('<HH',self.data,pos+i*4)
+				if idx == entry:
+					return offset*4
+			return None
+		if entry >= count:
+			return None
+		if flags & FLAG_OFFSET16:
+			offset = struct.unpack_from('<H',self.data,pos+entry*2)[0]
+			return None if offset == 0xFFFF else offset*4
+		offset = struct.unpack_from('<I',self.data,pos+entry*4)[0]
+		return None if offset == NO_ENTRY else offset
+
+	# follows references until a string, preferring the default configuration like aapt's application-label
+	def resolve(self,resid,depth=8):
+		best = None
+		for config, dtype, value in self.values(resid):
+			# config starts with its own size, a default config is all zero after that
+			rank = 0 if not any(config[4:]) else 1 if not any(config[8:12]) else 2
+			if best is None or rank < best[0]:
+				best = (rank,dtype,value)
+		if best is None:
+			return None
+		_, dtype, value = best
+		if dtype == TYPE_STRING:
+			return self.strings[value]
+		if dtype == TYPE_REFERENCE and depth > 0:
+			return self.resolve(value,depth-1)
+		return None
+
+def _value(attr,table):
+	if attr is None:
+		return None
+	dtype, value = attr
+	if dtype == TYPE_STRING:
+		return value
+	if dtype == TYPE_REFERENCE and table is not None:
+		return table.resolve(value)
+	if dtype >= 0x10:
+		return str(value)
+	return None
+
+def readApkInfo(apkpath):
+	with zipfile.ZipFile(apkpath) as z:
+		elements = parseManifest(z.read('AndroidManifest.xml'))
+		manifest = elements.get('manifest',{})
+		application = elements.get('application',{})
+		table = None
+		if any(x is not None and x[0] == TYPE_REFERENCE for x in (manifest.get(ATTR_VERSIONNAME),application.get(ATTR_LABEL))):
+			table = ResourceTable(z.read('resources.arsc'))
+	name = _value(manifest.get('package'),None)
+	if not name:
+		raise AxmlError(f'No package name in {apkpath}')
+	version = _value(manifest.get(ATTR_VERSIONNAME),table)
+	label = _value(application.get(ATTR_LABEL),table) or name
+	return Apk(
+		path=Path(apkpath),
+		name=name,
+		version=version or "0.0",
+		title=label.replace(' ', '_')
+	)
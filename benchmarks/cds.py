@@ -0,0 +1,61 @@
+from pathlib import Path
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+sys.path.insert(0,str(Path(__file__).resolve().parent.parent))
+from patchtool import Revanced
+
+# compares revanced-cli startup without and with the class data sharing archive
+# each run is a full jvm start reading the patch bundle, the same work the archive is trained on
+
+def timeRuns(command,runs):
+	times = []
+	for _ in range(runs):
+		start = time.perf_counter()
+		subprocess.run(command,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+		times.append(time.perf_counter() - start)
+	return times
+
+def summary(times):
+	return {'runs':len(times),'mean':statistics.mean(times),'median':statistics.median(times),'min':min(times),'max':max(times)}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark cold vs CDS-warmed revanced-cli startup')
+	parser.add_argument('--settings',default='settings.yaml')
+	parser.add_argument('--runs',type=int,default=5)
+	parser.add_argument('--out',type=Path,default=Path(__file__).parent / 'results')
+	args = parser.parse_args()
+
+	rev = Revanced(args.settings,offline=True)
+	if rev.revancedcli is None or rev.revancedpatch is None:
+		sys.exit('revanced-cli and revanced-patches jars are needed, run patchtool once online first')
+	java = rev.settings.javaFile.absolute().as_posix()
+	profile = [str(x) for x in rev.settings.jvmProfiles.get(rev.settings.jvmProfile,[])]
+	tail = ['-jar',rev.revancedcli.absolute().as_posix(),'list-patches',rev.revancedpatch.absolute().as_posix()]
+
+	start = time.perf_counter()
+	built = rev.buildCDSArchive()
+	buildtime = time.perf_counter() - start
+	if not built:
+		sys.exit(f'Could not build a CDS archive with {java}, it needs jdk 13 or newer')
+
+	cold = timeRuns([java,*profile,*tail],args.runs)
+	warm = timeRuns([java,*profile,f'-XX:SharedArchiveFile={rev.cdsArchive().absolute().as_posix()}',*tail],args.runs)
+	result = {
+		'benchmark':'cds',
+		'date':datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+		'cli':rev.revancedcli.name,
+		'jvmProfile':rev.settings.jvmProfile,
+		'archiveBuild':buildtime,
+		'cold':summary(cold),
+		'cds':summary(warm),
+		'speedup':statistics.median(cold) / statistics.median(warm)
+	}
+	args.out.mkdir(parents=True,exist_ok=True)
+	outfile = args.out / f'cds-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json'
+	outfile.write_text(json.dumps(result,indent=1))
+	print(f"cold {result['cold']['median']:.2f}s, cds {result['cds']['median']:.2f}s, {result['speedup']:.2f}x ({outfile})")
@@ -0,0 +1,176 @@
+from pathlib import Path
+import os
+import sys
+import json
+import yaml
+import random
+import struct
+import zipfile
+from datetime import date
+
+# synthetic inputs for the benchmarks: patch catalogs, apk folders and stand-ins for java and aapt
+# everything lives in one workspace folder with its own settings.yaml, so a scenario runs with its cwd there
+
+REPO = Path(__file__).resolve().parent.parent
+
+def patchCatalog(patches=400,packages=100,universal=20,seed=1):
+	rnd = random.Random(seed)
+	names = [f'com.bench.app{i}' for i in range(packages)]
+	catalog = []
+	for i in range(patches):
+		options = [{
+			'key':f'option{j}',
+			'default':rnd.choice([True,'value',3,None]),
+			'title':f'Option {j}',
+			'description':'Synthetic option used by the benchmarks',
+			'required':rnd.random() < 0.1
+		} for j in range(rnd.choice([0,0,0,1,2]))]
+		compatible = None
+		if i >= universal:
+			compatible = [{
+				'name':x,
+				'versions':[f'{rnd.randint(1,20)}.{rnd.randint(0,50)}.{rnd.randint(0,50)}' for _ in range(rnd.randint(0,4))] or None
+			} for x in rnd.sample(names,min(packages,rnd.randint(1,3)))]
+		catalog.append({
+			'name':f'Patch {i}',
+			'description':'Synthetic patch used by the benchmarks',
+			'compatiblePackages':compatible,
+			'use':rnd.random() < 0.7,
+			'requiresIntegrations':False,
+			'options':options
+		})
+	return catalog
+
+def _stringPool(strings):
+	data = b''
+	offsets = []
+	for s in strings:
+		offsets.append(len(data))
+		data += struct.pack('<H',len(s)) + s.encode('utf-16-le') + b'\0\0'
+	data += b'\0' * (-len(data) % 4)
+	body = struct.pack(f'<{len(strings)}I',*offsets) + data
+	return struct.pack('<HHIIIIII',0x0001,28,28+len(body),len(strings),0,0,28+4*len(strings),0) + body
+
+def _element(name,attrs):
+	body = struct.pack('<IIHHHHHH',0xFFFFFFFF,name,20,20,len(attrs),0,0,0) + b''.join(attrs)
+	return struct.pack('<HHIII',0x0102,16,16+len(body),1,0xFFFFFFFF) + body
+
+def _stringAttr(name,value):
+	return struct.pack('<IIIHBBI',0xFFFFFFFF,name,value,8,0,0x03,value)
+
+# binary AndroidManifest.xml with package, versionName and a plain string label
+def manifest(package,version,label):
+	strings = ['label','versionName','package','manifest','application',version,package,label]
+	resmap = struct.pack('<II',0x01010001,0x0101021c)
+	body = (
+		_stringPool(strings)
+		+ struct.pack('<HHI',0x0180,8,8+len(resmap)) + resmap
+		+ _element(3,[_stringAttr(1,5),_stringAttr(2,6)])
+		+ _element(4,[_stringAttr(0,7)])
+	)
+	return struct.pack('<HHI',0x0003,8,8+len(body)) + body
+
+def writeApk(path,package,version,label,size=0):
+	with zipfile.ZipFile(path,'w') as z:
+		z.writestr('AndroidManifest.xml',manifest(package,version,label))
+		if size:
+			z.writestr('classes.dex',os.urandom(size))
+
+def apkFolder(folder,count,packages=100,versions=3,size=0,seed=1):
+	rnd = random.Random(seed)
+	folder = Path(folder)
+	folder.mkdir(parents=True,exist_ok=True)
+	apks = []
+	for i in range(count):
+		app = i % packages
+		version = f'{rnd.randint(1,20)}.{(i // packages) % versions}.{rnd.randint(0,50)}'
+		path = folder / f'app{app}-{i}.apk'
+		writeApk(path,f'com.bench.app{app}',version,f'Bench App {app}',size)
+		apks.append(path)
+	return apks
+
+def _script(path,source):
+	path = Path(path)
+	path.write_text(f'#!{sys.executable}\n' + source)
+	if os.name == 'nt':
+		wrapper = path.with_suffix('.cmd')
+		wrapper.write_text(f'@"{sys.executable}" "{path}" %*\n')
+		return wrapper
+	path.chmod(0o755)
+	return path
+
+# java stand-in: sleeps for latency, logs revanced-cli's phases and a line per selected patch and copies the input apk to --out
+def stubJava(folder,latency=0.0):
+	return _script(Path(folder) / 'java',f'''
+import sys, time, shutil
+args = sys.argv[1:]
+for arg in args:
+	if arg.startswith('-XX:ArchiveClassesAtExit='):
+		open(arg.split('=',1)[1],'w').write('stub')
+time.sleep({latency!r})
+if 'patch' in args:
+	print('INFO: Decoding app manifest')
+	print('INFO: Executing patches')
+	for i,arg in enumerate(args):
+		if arg == '-i':
+			print('INFO: ' + args[i+1] + ' succeeded')
+	print('INFO: Compiling modified dex files')
+	print('INFO: Signing APK')
+	out = args[args.index('--out')+1]
+	shutil.copyfile(args[-1],out)
+	print('INFO: Saved to ' + out)
+''')
+
+# aapt stand-in: answers dump badging for apks made by writeApk, after sleeping for latency
+# it reads the manifest's string pool itself so the stub's own startup stays small next to the latency
+def stubAapt(folder,latency=0.0):
+	return _script(Path(folder) / 'aapt',f'''
+import sys, time, struct, zipfile
+time.sleep({latency!r})
+data = zipfile.ZipFile(sys.argv[-1]).read('AndroidManifest.xml')
+count, start = struct.unpack_from('<I',data,16)[0], struct.unpack_from('<I',data,28)[0]
+def string(i):
+	pos = 8 + start + struct.unpack_from('<I',data,36+i*4)[0]
+	size = struct.unpack_from('<H',data,pos)[0]
+	return data[pos+2:pos+2+size*2].decode('utf-16-le')
+version, package, label = string(5), string(6), string(7)
+print(f"package: name='{{package}}' versionCode='1' versionName='{{version}}' ")
+print(f"application-label:'{{label}}'")
+''')
+
+# a complete folder layout: tools, catalog, apks, keystores and a settings.yaml pointing at them with absolute paths
+def workspace(root,apks=50,patches=400,packages=100,javaLatency=0.0,aaptLatency=0.0,backend='python',jobs=1,apkSize=0):
+	root = Path(root).absolute()
+	for folder in ('revanced/revanced-cli','revanced/revanced-patches','revanced/revanced-integrations','stubs','output'):
+		(root / folder).mkdir(parents=True,exist_ok=True)
+	(root / 'revanced/revanced-cli/revanced-cli-4.0.0-all.jar').write_bytes(b'stub')
+	(root / 'revanced/revanced-patches/revanced-patches-4.0.0.jar').write_bytes(b'stub')
+	(root / 'revanced/revanced-integrations/revanced-integrations-1.0.0.apk').write_bytes(b'stub')
+	(root / 'revanced/revanced-patches/revanced-patches-4.0.0.json').write_text(json.dumps(patchCatalog(patches,packages)))
+	java = stubJava(root / 'stubs',javaLatency)
+	stubAapt(root / 'stubs',aaptLatency)
+	apkFolder(root / 'apks',apks,packages,size=apkSize)
+	for app in range(min(apks,packages)):
+		(root / 'output' / f'Revanced-Bench_App_{app}.keystore').write_bytes(b'stub')
+	settings = {
+		'lastupDate':str(date.today()),
+		'apkFolder':str(root / 'apks'),
+		'outputFolder':str(root / 'output'),
+		'revancedcliFolder':str(root / 'revanced/revanced-cli'),
+		'revancedpatchesFolder':str(root / 'revanced/revanced-patches'),
+		'revancedintegrationsFolder':str(root / 'revanced/revanced-integrations'),
+		'revancedCacheFolder':str(root / 'revanced-cache'),
+		'toolsjsonFile':str(root / 'revanced/tools.json'),
+		'errorFile':str(root / 'error.txt'),
+		'javaFile':str(java),
+		'apkinfoBackend':backend,
+		'offline':True,
+		'jvmCDS':False,
+		'patchJobs':jobs
+	}
+	(root / 'settings.yaml').write_text(yaml.safe_dump(settings))
+	return root
+
+# puts the aapt stub first on PATH, the aapt backend runs plain `aapt`
+def useStubs(root):
+	os.environ['PATH'] = str(Path(root) / 'stubs') + os.pathsep + os.environ.get('PATH','')
@@ -0,0 +1,216 @@
+from pathlib import Path
+import os
+import sys
+import json
+import time
+import shutil
+import atexit
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+sys.path.insert(0,str(Path(__file__).resolve().parent.parent))
+import fixtures
+from cds import summary
+from patchtool import Revanced
+
+# end to end timings on synthetic workspaces, no network, java or aapt needed
+# every scenario returns plain numbers so two result files can be compared with --compare
+
+def timeRuns(fn,runs,before=None):
+	times = []
+	for _ in range(runs):
+		if before is not None:
+			before()
+		start = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - start)
+	return times
+
+def revanced(root):
+	os.chdir(root)
+	return release(Revanced(root / 'settings.yaml',offline=True,refresh=False))
+
+# the workspace is deleted before exit, so its settings and caches must not be saved back then
+def release(rev):
+	for save in (rev.saveSettings,rev.apkcache.save,rev.manifest.save):
+		atexit.unregister(save)
+	return rev
+
+def clearCatalogs(root):
+	for f in (Path(root) / 'revanced-cache').glob('catalog-*.pickle'):
+		f.unlink()
+
+def benchLoadPatches(base,args):
+	results = {}
+	for size in args.catalogs:
+		root = fixtures.workspace(base / f'catalog{size}',apks=0,patches=size,packages=max(10,size // 4))
+		rev = revanced(root)
+		results[str(size)] = {
+			'cold':summary(timeRuns(rev.loadPatches,args.runs,lambda: clearCatalogs(root))),
+			'warm':summary(timeRuns(rev.loadPatches,args.runs))
+		}
+	return results
+
+def benchScan(base,args):
+	results = {}
+	for backend in ('python','aapt'):
+		root = fixtures.workspace(base / f'scan-{backend}',apks=args.apks,backend=backend,aaptLatency=args.aapt_latency)
+		fixtures.useStubs(root)
+		rev = revanced(root)
+		paths = list(rev.settings.apkFolder.rglob('*.apk'))
+		scan = lambda: [rev.getApkInfo(x) for x in paths]
+		cold = timeRuns(scan,args.runs,rev.apkcache.purge)
+		warm = timeRuns(scan,args.runs)
+		results[backend] = {
+			'apks':len(paths),
+			'cold':summary(cold),
+			'warm':summary(warm),
+			'coldApksPerSecond':len(paths) / min(cold)
+		}
+	return results
+
+def benchCommand(base,args):
+	root = fixtures.workspace(base / 'command',apks=args.apks)
+	rev = revanced(root)
+	apks = [rev.loadAPK(x) for x in rev.settings.apkFolder.rglob('*.apk')]
+	# half the apks carry their own patch selection, the rest fall back to the defaults
+	for apk in apks[::2]:
+		apk.patches.write_text(json.dumps(list(rev.getApkPatches(apk.name).patches)[:5]))
+	times = timeRuns(lambda: [rev.getPatchCommand(x) for x in apks],args.runs)
+	return {'apks':len(apks),'all':summary(times),'perApk':min(times) / max(1,len(apks))}
+
+def benchRun(base,args):
+	root = fixtures.workspace(base / 'run',apks=args.batch,javaLatency=args.java_latency)
+	rev = revanced(root)
+	results = {}
+	for jobs in args.jobs:
+		times = timeRuns(lambda: rev.run(jobs=jobs,force=True,allVersions=True),args.runs)
+		results[str(jobs)] = {'apks':args.batch,'batch':summary(times),'apksPerSecond':args.batch / min(times)}
+	return results
+
+def benchGui(base,args):
+	try:
+		os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+		from PyQt5.QtWidgets import QApplication
+		from PyQt5 import QtCore
+		import gui
+	except ImportError as e:
+		return {'skipped':str(e)}
+	root = fixtures.workspace(base / 'gui',apks=args.apks)
+	os.chdir(root)
+	app = QApplication.instance() or QApplication([])
+	window = gui.MainWindow()
+	release(window.rev)
+	def populate():
+		window.reload()
+		while window.lsv.scanTotal is None or window.lsv.scanned < window.lsv.scanTotal:
+			app.processEvents()
+			QtCore.QThreadPool.globalInstance().waitForDone(5)
+		app.processEvents()
+	populate()
+	results = {
+		'apks':args.apks,
+		'cold':summary(timeRuns(populate,args.runs,window.rev.apkcache.purge)),
+		'warm':summary(timeRuns(populate,args.runs))
+	}
+	window.close()
+	return results
+
+def benchColdStart(base,args):
+	root = fixtures.workspace(base / 'start',apks=args.apks)
+	script = f'import sys; sys.path.insert(0,{str(fixtures.REPO)!r}); from patchtool import Revanced; Revanced(offline=True,refresh=False)'
+	start = lambda: subprocess.run([sys.executable,'-c',script],cwd=root,stdout=subprocess.DEVNULL,check=True)
+	return {
+		'empty':summary(timeRuns(start,args.runs,lambda: shutil.rmtree(root / 'revanced-cache',ignore_errors=True))),
+		'cached':summary(timeRuns(start,args.runs))
+	}
+
+SCENARIOS = {
+	'loadPatches':benchLoadPatches,
+	'scan':benchScan,
+	'command':benchCommand,
+	'run':benchRun,
+	'gui':benchGui,
+	'coldStart':benchColdStart
+}
+
+# path -> median for every timing in a result file
+def medians(data,prefix=''):
+	out = {}
+	for key, value in data.items():
+		if isinstance(value,dict) and 'median' in value:
+			out[prefix+key] = value['median']
+		elif isinstance(value,dict):
+			out |= medians(value,prefix+key+'.')
+	return out
+
+def compare(old,new):
+	old = medians(json.loads(Path(old).read_text())['scenarios'])
+	new = medians(json.loads(Path(new).read_text())['scenarios'])
+	width = max(len(x) for x in old | new)
+	print(f'{"":{width}}  {"old":>10}  {"new":>10}  change')
+	for key in sorted(old | new):
+		a, b = old.get(key), new.get(key)
+		ms = lambda x: f'{x*1000:>8.1f}ms' if x is not None else f'{"-":>10}'
+		change = f'{(b - a) / a * 100:+.1f}%' if a and b is not None else ''
+		print(f'{key:{width}}  {ms(a)}  {ms(b)}  {change}')
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark startup, scanning, command building and batch throughput on synthetic data')
+	parser.add_argument('scenarios',nargs='*',help=f'any of {", ".join(SCENARIOS)} (default: all)')
+	parser.add_argument('--runs',type=int,default=5)
+	parser.add_argument('--quick',action='store_true',help='small inputs and 2 runs, for checking the suite itself')
+	parser.add_argument('--catalogs',type=int,nargs='+',default=[100,1000,5000],help='patch counts for loadPatches')
+	parser.add_argument('--apks',type=int,default=200,help='apks for scan, command, gui and coldStart')
+	parser.add_argument('--batch',type=int,default=16,help='apks patched by run')
+	parser.add_argument('--jobs',type=int,nargs='+',default=[1,2,4],help='job counts for run')
+	parser.add_argument('--java-latency',type=float,default=0.2,help='seconds the java stub takes per patch')
+	parser.add_argument('--aapt-latency',type=float,default=0.02,help='seconds the aapt stub takes per apk')
+	parser.add_argument('--out',type=Path,default=Path(__file__).parent / 'results')
+	parser.add_argument('--keep',type=Path,default=None,help='build the workspaces here and leave them')
+	parser.add_argument('--compare',type=Path,nargs=2,metavar=('OLD','NEW'),help='print the change between two result files and exit')
+	args = parser.parse_args()
+	for name in args.scenarios:
+		if name not in SCENARIOS:
+			parser.error(f'unknown scenario {name}')
+	if args.compare:
+		compare(*args.compare)
+		sys.exit()
+	if args.quick:
+		args.runs, args.catalogs, args.apks, args.batch, args.jobs = 2, [100,1000], 20, 4, [1,2]
+	args.out = args.out.absolute()
+
+	cwd = Path.cwd()
+	tmp = None
+	if args.keep is None:
+		tmp = tempfile.TemporaryDirectory(prefix='revanced-bench-')
+		base = Path(tmp.name)
+	else:
+		base = args.keep.absolute()
+	results = {}
+	try:
+		for name in args.scenarios or SCENARIOS:
+			start = time.perf_counter()
+			results[name] = SCENARIOS[name](base,args)
+			print(f'{name} done in {time.perf_counter() - start:.1f}s',file=sys.stderr)
+	finally:
+		os.chdir(cwd)
+		if tmp is not None:
+			tmp.cleanup()
+
+	result = {
+		'benchmark':'suite',
+		'date':datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+		'python':platform.python_version(),
+		'platform':platform.platform(),
+		'args':{x:y for x,y in vars(args).items() if x not in ('out','keep','compare')},
+		'scenarios':results
+	}
+	args.out.mkdir(parents=True,exist_ok=True)
+	outfile = args.out / f'suite-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json'
+	outfile.write_text(json.dumps(result,indent=1,default=str))
+	for key, value in medians(results).items():
+		print(f'{key}: {value*1000:.1f}ms')
+	print(outfile)
@@ -0,0 +1,49 @@
+from pathlib import Path
+import json
+import os
+import threading
+from datetime import datetime
+
+# fingerprint of every patched apk in the output folder, a job is only run again when its fingerprint changes
+class BuildManifest:
+	def __init__(self,manifestFile:Path):
+		self.manifestFile = Path(manifestFile)
+		self.lock = threading.Lock()
+		self.dirty = False
+		try:
+			self.entries = json.loads(self.manifestFile.read_text(encoding='utf-8'))
+		except (OSError,ValueError):
+			self.entries = {}
+
+	@staticmethod
+	def key(output):
+		return Path(output).absolute().as_posix()
+
+	def isCurrent(self,output,fingerprint):
+		with self.lock:
+			entry = self.entries.get(self.key(output))
+		return entry is not None and entry['fingerprint'] == fingerprint and Path(output).exists()
+
+	def record(self,output,fingerprint,apkpath):
+		with self.lock:
+			self.entries[self.key(output)] = {
+				'fingerprint':fingerprint,
+				'input':Path(apkpath).absolute().as_posix(),
+				'built':datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+			}
+			self.dirty = True
+
+	def forget(self,output):
+		with self.lock:
+			if self.entries.pop(self.key(output),None) is not None:
+				self.dirty = True
+
+	def save(self):
+		with self.lock:
+			if not self.dirty: return
+			data = json.dumps(self.entries,indent=1)
+			self.dirty = False
+		self.manifestFile.parent.mkdir(parents=True,exist_ok=True)
+		tmp = self.manifestFile.with_suffix('.tmp')
+		tmp.write_text(data,encoding='utf-8')
+		os.replace(tmp,self.manifestFile)
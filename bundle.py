@@ -0,0 +1,121 @@
+from pathlib import Path
+import os
+import io
+import sys
+import json
+import tarfile
+from hashlib import sha256
+from datetime import datetime
+from apkcache import fileHash
+
+# the tools of one host in a single tar for hosts without internet: manifest.json first, then tools.json and
+# every tool under <kind>/<name>. the manifest comes first so an import can check each file as it streams past
+# and the archive can be piped in (`curl ... | python patchtool.py --import-bundle -`)
+
+BUNDLE_VERSION = 1
+CHUNK = 1024 * 1024
+
+class BundleError(Exception):
+	pass
+
+def _addBytes(tar,name,data):
+	info = tarfile.TarInfo(name)
+	info.size = len(data)
+	info.mtime = int(datetime.now().timestamp())
+	tar.addfile(info,io.BytesIO(data))
+
+# tools: kind -> path, sums: kind -> sha256 already known for that file
+def exportBundle(outfile,tools,toolsjson=None,sums=None):
+	sums = sums or {}
+	files = []
+	for kind, path in tools.items():
+		if path is None:
+			raise BundleError(f'no {kind} installed')
+		path = Path(path)
+		files.append({
+			'kind':kind,
+			'name':path.name,
+			'size':path.stat().st_size,
+			'sha256':sums.get(kind) or fileHash(path)
+		})
+	toolsdata = Path(toolsjson).read_bytes() if toolsjson and Path(toolsjson).exists() else None
+	manifest = {
+		'version':BUNDLE_VERSION,
+		'created':datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+		'toolsjson':sha256(toolsdata).hexdigest() if toolsdata is not None else None,
+		'files':files
+	}
+	outfile = Path(outfile)
+	tmp = outfile.with_name(outfile.name + '.tmp')
+	with tarfile.open(tmp,'w') as tar:
+		_addBytes(tar,'manifest.json',json.dumps(manifest,indent=1).encode('utf-8'))
+		if toolsdata is not None:
+			_addBytes(tar,'tools.json',toolsdata)
+		for entry in files:
+			tar.add(tools[entry['kind']],arcname=f'{entry["kind"]}/{entry["name"]}',recursive=False)
+	os.replace(tmp,outfile)
+	# sha256sum -c compatible, for checking the download before importing it
+	digest = fileHash(outfile)
+	outfile.with_name(outfile.name + '.sha256').write_text(f'{digest}  {outfile.name}\n')
+	return manifest, digest
+
+# folders: kind -> folder the file goes to, known(kind, path) -> sha256 of an installed file if already known
+# returns the installed and skipped paths, the bundle's tools.json content (or None) and its manifest
+def importBundle(source,folders,known=None):
+	installed, skipped = [], []
+	seen = set()
+	toolsjson = None
+	fileobj = sys.stdin.buffer if str(source) == '-' else None
+	with tarfile.open(None if fileobj else source,'r|*',fileobj=fileobj) as tar:
+		manifest = None
+		for member in tar:
+			if manifest is None:
+				if member.name != 'manifest.json':
+					raise BundleError('not a tool bundle, it does not start with manifest.json')
+				manifest = json.loads(tar.extractfile(member).read())
+				if manifest.get('version') != BUNDLE_VERSION:
+					raise BundleError(f'bundle version {manifest.get("version")} is not supported')
+				entries = {f'{x["kind"]}/{x["name"]}':x for x in manifest['files']}
+				continue
+			if not member.isfile():
+				continue
+			if member.name == 'tools.json':
+				toolsjson = tar.extractfile(member).read()
+				if sha256(toolsjson).hexdigest() != manifest['toolsjson']:
+					raise BundleError('tools.json does not match its checksum')
+				continue
+			entry = entries.get(member.name)
+			# anything not listed in the manifest, or trying to leave its folder, is ignored
+			if entry is None or entry['kind'] not in folders or Path(entry['name']).name != entry['name']:
+				continue
+			seen.add(member.name)
+			target = Path(folders[entry['kind']]) / entry['name']
+			if target.exists() and target.stat().st_size == entry['size']:
+				digest = known(entry['kind'],target) if known else None
+				if (digest or fileHash(target)) == entry['sha256']:
+					skipped.append(target)
+					continue
+			_extract(tar.extractfile(member),target,entry['sha256'])
+			installed.append(target)
+		if manifest is None:
+			raise BundleError('empty bundle')
+	missing = [x for x,y in entries.items() if x not in seen and y['kind'] in folders]
+	if missing:
+		raise BundleError(f'bundle is cut short, missing {", ".join(missing)}')
+	return installed, skipped, toolsjson, manifest
+
+# streamed to a temp file next to the target and hashed on the way, only renamed into place when the checksum matches
+def _extract(source,target,digest):
+	target.parent.mkdir(parents=True,exist_ok=True)
+	tmp = target.with_name(target.name + '.part')
+	h = sha256()
+	try:
+		with open(tmp,'wb') as f:
+			for chunk in iter(lambda: source.read(CHUNK),b''):
+				h.update(chunk)
+				f.write(chunk)
+		if h.hexdigest() != digest:
+			raise BundleError(f'{target.name} does not match its checksum')
+		os.replace(tmp,target)
+	finally:
+		tmp.unlink(missing_ok=True)
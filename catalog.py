@@ -0,0 +1,213 @@
+from pathlib import Path
+import json
+import os
+import pickle
+from hashlib import sha256
+from validation import Patch
+from settings import versionKey
+
+# bump whenever PatchCatalog, Patch or Option change shape so old compiled catalogs are rebuilt
+CATALOG_SCHEMA = 4
+
+# every patch of a revanced-patches json stored once, with package -> patch and patch -> version indexes
+# apps only get a view over those patches, universal patches are shared by every view instead of copied in
+class PatchCatalog:
+	def __init__(self,patches):
+		self.patches = []
+		# default option values, shared patches are reset to these before another apk's options are loaded
+		self.defaults = []
+		self.universal = []
+		self.packages = {}
+		self.versions = {}
+		self.views = {}
+		for raw in patches:
+			compatible = raw.get('compatiblePackages')
+			patch = Patch(**{x:y for x,y in raw.items() if x != 'compatiblePackages'})
+			index = len(self.patches)
+			self.patches.append(patch)
+			self.defaults.append({x.key:x.value for x in patch.options.values()})
+			if compatible is None:
+				self.universal.append(index)
+				continue
+			for package in compatible:
+				self.packages.setdefault(package['name'],[]).append(index)
+				# None means every version of the package
+				self.versions[(index,package['name'])] = package.get('versions')
+		self.buildMatrix()
+
+	# package -> version key -> patches that name that version, plus per package the patches that work on any
+	# version and the best version to patch, so compatibility questions are dict lookups instead of list scans
+	def buildMatrix(self):
+		self.matrix = {}
+		self.anyVersion = {}
+		self.targets = {}
+		self.newest = {}
+		self.byPatch = {}
+		for (index,package),versions in self.versions.items():
+			self.byPatch.setdefault(index,{})[package] = versions
+			if versions is None:
+				self.anyVersion.setdefault(package,set()).add(index)
+				continue
+			byversion = self.matrix.setdefault(package,{})
+			for version in versions:
+				byversion.setdefault(versionKey(version),(version,set()))[1].add(index)
+		for package, byversion in self.matrix.items():
+			# the version most patches name, the newest of those when several tie
+			key = max(byversion,key=lambda x: (len(byversion[x][1]),x))
+			self.targets[package] = (key,byversion[key][0])
+			self.newest[package] = max(byversion)
+		self.compatibleCache = {}
+		self.indexOf = {id(x):i for i,x in enumerate(self.patches)}
+
+	# views are rebuilt on demand, only the patches and indexes are stored in the compiled cache
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['views'] = {}
+		state['compatibleCache'] = {}
+		del state['indexOf']
+		return state
+
+	# the patches are new objects after unpickling, so their ids are mapped again
+	def __setstate__(self,state):
+		self.__dict__.update(state)
+		self.indexOf = {id(x):i for i,x in enumerate(self.patches)}
+
+	def __contains__(self,name):
+		return name == 'defaults' or name in self.packages
+
+	def __getitem__(self,name):
+		if name not in self:
+			raise KeyError(name)
+		if name not in self.views:
+			self.views[name] = AppView(self,name)
+		return self.views[name]
+
+	def __len__(self):
+		return len(self.packages) + 1
+
+	def keys(self):
+		return ['defaults',*self.packages]
+
+	def items(self):
+		return [(x,self[x]) for x in self.keys()]
+
+	def values(self):
+		return [self[x] for x in self.keys()]
+
+	# indexes of every patch that can be applied to this exact version of the package
+	def compatible(self,package,version):
+		key = (package,versionKey(version))
+		if key not in self.compatibleCache:
+			exact = self.matrix.get(package,{}).get(key[1])
+			self.compatibleCache[key] = frozenset(self.universal).union(self.anyVersion.get(package,()),exact[1] if exact else ())
+		return self.compatibleCache[key]
+
+	# whether a patch of the package names this version, any version is supported when none of them name one
+	def supports(self,package,version):
+		byversion = self.matrix.get(package)
+		return byversion is None or versionKey(version) in byversion
+
+	# the version to patch, None when no patch of the package names a version
+	def target(self,package):
+		target = self.targets.get(package)
+		return target[1] if target else None
+
+	# -1 older than the target version, 1 newer than every version a patch names, else 0, None without a target
+	def compareTarget(self,package,version):
+		target = self.targets.get(package)
+		if target is None:
+			return None
+		key = versionKey(version)
+		if key < target[0]:
+			return -1
+		return 1 if key > self.newest[package] else 0
+
+	# package -> supported versions for one patch, given as its catalog index or the Patch itself
+	def patchVersions(self,patch):
+		index = self.indexOf[id(patch)] if isinstance(patch,Patch) else patch
+		return dict(self.byPatch.get(index,{}))
+
+class AppView:
+	def __init__(self,catalog,name):
+		self.catalog = catalog
+		self.package = name
+		if name == 'defaults':
+			self.name = 'General Apps'
+			self.description = 'Can be applied to any app'
+			self.indexes = list(catalog.universal)
+		else:
+			self.name = name
+			self.description = None
+			self.indexes = catalog.universal + catalog.packages[name]
+		self._byname = None
+		self._patches = None
+
+	# patch name -> catalog index, a later patch with the same name replaces an earlier one like before
+	@property
+	def byname(self):
+		if self._byname is None:
+			self._byname = {self.catalog.patches[x].name:x for x in self.indexes}
+		return self._byname
+
+	# references into the catalog, editing an option here edits it for every app sharing the patch
+	@property
+	def patches(self):
+		if self._patches is None:
+			self._patches = {x:self.catalog.patches[y] for x,y in self.byname.items()}
+		return self._patches
+
+	# versions of this app the patch works on, None when it works on all of them
+	def versions(self,patch):
+		name = patch if isinstance(patch,str) else patch.name
+		return self.catalog.versions.get((self.byname[name],self.package))
+
+	def isCompatible(self,patch,version):
+		name = patch if isinstance(patch,str) else patch.name
+		return self.byname[name] in self.catalog.compatible(self.package,version)
+
+	def getLatest(self):
+		return self.catalog.target(self.package) or "Latest"
+
+	def getOptions(self):
+		defaults = []
+		for patch in self.patches.values():
+			if len(patch.options) > 0 :
+				tmp = {'patchName':patch.name}
+				tmp['options'] = []
+				for option in patch.options.values():
+					tmp['options'].append({
+						'key':option.key,
+						'value':option.value
+					})
+				defaults.append(tmp)
+		return defaults
+
+	def resetOptions(self):
+		for index in self.byname.values():
+			for key,value in self.catalog.defaults[index].items():
+				self.catalog.patches[index].options[key].value = value
+
+# the parsed catalog of a patches json is pickled next to its content hash,
+# so validation only runs again when a new bundle is downloaded
+def loadCatalog(patchesFile,cacheFolder):
+	data = Path(patchesFile).read_bytes()
+	digest = sha256(data + f'schema{CATALOG_SCHEMA}'.encode()).hexdigest()
+	cacheFolder = Path(cacheFolder)
+	compiled = cacheFolder / f'catalog-{digest}.pickle'
+	if compiled.exists():
+		try:
+			with compiled.open('rb') as f:
+				catalog = pickle.load(f)
+			if isinstance(catalog,PatchCatalog):
+				return catalog
+		except Exception:
+			pass
+	catalog = PatchCatalog(json.loads(data))
+	cacheFolder.mkdir(parents=True,exist_ok=True)
+	for old in cacheFolder.glob('catalog-*.pickle'):
+		old.unlink(missing_ok=True)
+	tmp = compiled.with_suffix('.tmp')
+	with tmp.open('wb') as f:
+		pickle.dump(catalog,f,protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(tmp,compiled)
+	return catalog
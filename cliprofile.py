@@ -0,0 +1,134 @@
+import re
+import time
+import codecs
+import threading
+
+# follows revanced-cli's log while it runs: which phase it is in, which patches finished and how long each took
+# revanced-cli only reports a patch when it is done and runs them one after another,
+# so a patch is timed from the previous patch result (or the start of the patching phase)
+
+# phase, what its INFO lines contain, progress percentage when it starts
+PHASES = [
+	('startup',None,0),
+	('decoding',re.compile(r'decod|loading|reading|setting up',re.I),5),
+	('patching',re.compile(r'executing patches|applying patches|merging (?:integrations|extensions)',re.I),15),
+	('compiling',re.compile(r'compil|writing|rebuilding|building',re.I),85),
+	('aligning',re.compile(r'align',re.I),92),
+	('signing',re.compile(r'sign',re.I),95),
+	('saving',re.compile(r'saved|saving|purging',re.I),99)
+]
+ORDER = {x[0]:i for i,x in enumerate(PHASES)}
+
+LEVEL = re.compile(r'^\s*\[?(INFO|WARNING|SEVERE|ERROR)\]?:?\s*(.*)$')
+RESULT = re.compile(r'^["\[]?(.+?)["\]]? (succeeded|failed)\b')
+
+class PatchProfiler:
+	def __init__(self,expected=None,clock=time.monotonic):
+		self.expected = expected
+		self.clock = clock
+		self.lock = threading.Lock()
+		# stream -> its decoder and unterminated line, each stream is only written by its own reader thread
+		self.decoders = {}
+		self.partial = {}
+		self.started = clock()
+		self.phase = 'startup'
+		self.phaseStart = self.started
+		self.phases = {}
+		self.patches = []
+		self.lastPatch = None
+		self.finished = None
+
+	# raw output of one stream as it arrives
+	def write(self,data,stream='stdout'):
+		if stream not in self.decoders:
+			self.decoders[stream] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+			self.partial[stream] = ''
+		text = self.partial[stream] + self.decoders[stream].decode(data)
+		lines = text.split('\n')
+		self.partial[stream] = lines.pop()
+		for line in lines:
+			self.feed(line)
+
+	# a runner sink for one stream, stdout and stderr each need their own
+	def sink(self,stream):
+		return lambda data: self.write(data,stream)
+
+	# one line of output, returns the events it caused: ('phase', name) or ('patch', entry)
+	def feed(self,line):
+		m = LEVEL.match(line.rstrip('\r'))
+		if m is None:
+			return []
+		level, message = m.groups()
+		now = self.clock()
+		with self.lock:
+			result = RESULT.match(message)
+			if result is not None:
+				if ORDER[self.phase] < ORDER['patching']:
+					self._enter('patching',now)
+				start = self.lastPatch if self.lastPatch is not None else self.phaseStart
+				entry = {'name':result.group(1),'ok':result.group(2) == 'succeeded','elapsed':now - start}
+				self.patches.append(entry)
+				self.lastPatch = now
+				return [('patch',entry)]
+			if level != 'INFO':
+				return []
+			for phase, pattern, _ in PHASES[1:]:
+				if pattern.search(message):
+					if ORDER[phase] > ORDER[self.phase]:
+						self._enter(phase,now)
+						return [('phase',phase)]
+					break
+		return []
+
+	def _enter(self,phase,now):
+		self.phases[self.phase] = self.phases.get(self.phase,0.0) + now - self.phaseStart
+		self.phase = phase
+		self.phaseStart = now
+
+	def finish(self):
+		if self.finished is not None:
+			return
+		for stream, decoder in self.decoders.items():
+			line = self.partial[stream] + decoder.decode(b'',final=True)
+			self.partial[stream] = ''
+			if line:
+				self.feed(line)
+		with self.lock:
+			self.finished = self.clock()
+			self.phases[self.phase] = self.phases.get(self.phase,0.0) + self.finished - self.phaseStart
+
+	@property
+	def done(self):
+		return len(self.patches)
+
+	@property
+	def failed(self):
+		return sum(not x['ok'] for x in self.patches)
+
+	# 0 to 100, the patching phase moves with the share of expected patches reported so far
+	def progress(self):
+		if self.finished is not None:
+			return 100
+		start = PHASES[ORDER[self.phase]][2]
+		if self.phase == 'patching' and self.expected:
+			return start + (PHASES[ORDER['compiling']][2] - start) * min(1.0,self.done / self.expected)
+		return start
+
+	def profile(self):
+		with self.lock:
+			end = self.finished if self.finished is not None else self.clock()
+			phases = dict(self.phases)
+			if self.finished is None:
+				phases[self.phase] = phases.get(self.phase,0.0) + end - self.phaseStart
+			return {
+				'elapsed':end - self.started,
+				'expected':self.expected,
+				'phases':phases,
+				'patches':list(self.patches)
+			}
+
+	def describe(self):
+		if self.phase == 'patching':
+			total = f'/{self.expected}' if self.expected else ''
+			return f'patching {self.done}{total}'
+		return self.phase
@@ -1,5 +1,9 @@
 from pathlib import Path
 import sys,json
+import os
+import codecs
+import threading
+import time
 from patchtool import Revanced
 import webbrowser
 # For PyQt5 :
@@ -8,27 +12,111 @@ from PyQt5 import QtWidgets, QtCore
 # import qdarktheme
 import qdarkstyle
 from PyQt5.QtGui import QKeySequence, QColor
-from pyqtspinner import WaitingSpinner
+from apkcache import fileStat
+from cliprofile import PatchProfiler
+from guimodels import ApkTableModel, PatchListModel, AppTableModel, JobTableModel, filterProxy
+
+# lines of process output kept on screen, the full output is in the log file
+LOG_LINES = 5000
+
+# process output pane, decoded incrementally and painted in batches
+# only the last lines stay on screen, the whole output is streamed to the apk's .log (and stderr to its .error)
+class LogView(QPlainTextEdit):
+	def __init__(self,maxLines=LOG_LINES,parent=None):
+		super().__init__(parent)
+		self.setReadOnly(True)
+		self.setMaximumBlockCount(maxLines)
+		self.decoders = {x:codecs.getincrementaldecoder('utf-8')(errors='replace') for x in ('stdout','stderr')}
+		self.partial = {'stdout':'','stderr':''}
+		self.pending = []
+		self.logfile = None
+		self.errorfile = None
+		self.errorpath = None
+		# gets every complete line, e.g. a PatchProfiler
+		self.profiler = None
+		self.timer = QtCore.QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.setInterval(100)
+		self.timer.timeout.connect(self.flush)
+
+	def open(self,apk):
+		self.closeLog()
+		if apk is None: return
+		self.logfile = apk.patchLog.open('wb')
+		self.errorpath = apk.errorLog
+		self.errorpath.unlink(missing_ok=True)
+
+	def feed(self,data,stream='stdout'):
+		if not data: return
+		if self.logfile is not None:
+			self.logfile.write(data)
+		if stream == 'stderr' and self.errorpath is not None:
+			if self.errorfile is None:
+				self.errorfile = self.errorpath.open('wb')
+			self.errorfile.write(data)
+		text = self.partial[stream] + self.decoders[stream].decode(data)
+		lines = text.split('\n')
+		self.partial[stream] = lines.pop()
+		self.pending += lines
+		if self.profiler is not None:
+			for line in lines:
+				self.profiler.feed(line)
+		if not self.timer.isActive():
+			self.timer.start()
+
+	def message(self,s):
+		self.pending.append(s)
+		if not self.timer.isActive():
+			self.timer.start()
+
+	def flush(self):
+		self.timer.stop()
+		if not self.pending: return
+		lines = self.pending[-self.maximumBlockCount():]
+		self.pending = []
+		self.appendPlainText('\n'.join(x.rstrip('\r') for x in lines))
+
+	# end of a process, the undecoded tail and the last unterminated lines are shown too
+	# not close(), that would be QWidget.close and hide the log view
+	def closeLog(self):
+		for stream, decoder in self.decoders.items():
+			tail = self.partial[stream] + decoder.decode(b'',final=True)
+			if tail:
+				self.pending.append(tail)
+				if self.profiler is not None:
+					self.profiler.feed(tail)
+			self.partial[stream] = ''
+			decoder.reset()
+		self.flush()
+		for f in (self.logfile,self.errorfile):
+			if f is not None:
+				f.close()
+		self.logfile = None
+		self.errorfile = None
 
 class ProcessWindow(QDialog):
 
-	def __init__(self,app,command,auto=False,progress=None):
+	# expected is how many patches revanced-cli should report, for the percentage
+	def __init__(self,app,command,auto=False,progress=None,apk=None,expected=None):
 		super().__init__()
 		self.progress = progress
 		self.command = command
+		self.apk = apk
+		self.expected = expected
+		self.profiler = None
 		self.p = None
 		self.auto = auto
-		self.error = ''
-		self.res = ''
 		self.btn = QPushButton(f"Execute: {app}")
 		self.btn.pressed.connect(self.start_process)
-		self.text = QPlainTextEdit()
-		self.text.setReadOnly(True)
+		self.text = LogView()
+		self.bar = QProgressBar()
+		self.bar.setFormat('%p%')
 
 		l = QVBoxLayout()
 		if progress is not None:
 			l.addWidget(progress)
 		l.addWidget(self.btn)
+		l.addWidget(self.bar)
 		l.addWidget(self.text)
 
 		
@@ -37,45 +125,266 @@ class ProcessWindow(QDialog):
 			self.start_process()
 
 	def message(self, s):
-		self.text.appendPlainText(s)
+		self.text.message(s)
 
 	def start_process(self):
 		if self.p is None:  # No process running.
 			self.message("Executing process")
+			self.text.open(self.apk)
+			self.profiler = self.text.profiler = PatchProfiler(self.expected)
+			self.showProgress()
 			self.p = QtCore.QProcess()  # Keep a reference to the QProcess (e.g. on self) while it's running.
 			self.p.readyReadStandardOutput.connect(self.handle_stdout)
 			self.p.readyReadStandardError.connect(self.handle_stderr)
-			self.p.stateChanged.connect(self.handle_state)
 			self.p.finished.connect(self.process_finished)  # Clean up once complete.
 			self.p.start(self.command)
 
 	def handle_stderr(self):
-		data = self.p.readAllStandardError()
-		stderr = bytes(data).decode("utf8")
-		self.error += stderr
-		self.message(stderr)
+		self.text.feed(bytes(self.p.readAllStandardError()),'stderr')
+		self.showProgress()
 
 	def handle_stdout(self):
-		data = self.p.readAllStandardOutput()
-		stdout = bytes(data).decode("utf8")
-		self.res += stdout
-		self.message(stdout)
-
-	def handle_state(self, state):
-		states = {
-			QtCore.QProcess.NotRunning: 'Not running',
-			QtCore.QProcess.Starting: 'Starting',
-			QtCore.QProcess.Running: 'Running',
-		}
-		state_name = states[state]
-		self.message(f"State changed: {state_name}")
-
-	def process_finished(self):
-		self.message("Process finished.")
+		self.text.feed(bytes(self.p.readAllStandardOutput()))
+		self.showProgress()
+
+	def showProgress(self):
+		failed = f', {self.profiler.failed} failed' if self.profiler.failed else ''
+		self.bar.setValue(int(self.profiler.progress()))
+		self.bar.setFormat(f'%p% {self.profiler.describe()}{failed}')
+
+	def process_finished(self,code=0,status=None):
+		self.text.closeLog()
+		self.profiler.finish()
+		self.showProgress()
+		self.bar.setFormat(f'{"done" if code == 0 else "failed"} in {self.profiler.profile()["elapsed"]:.1f}s')
+		self.message(f"Process finished ({code}).")
+		self.message(profileSummary(self.profiler.profile()))
+		self.text.flush()
 		self.p = None
 		if self.auto:
 			super().accept()
 
+# where the time went: each phase, then the slowest patches
+def profileSummary(profile,top=5):
+	phases = ', '.join(f'{x} {y:.1f}s' for x,y in profile['phases'].items())
+	slowest = sorted(profile['patches'],key=lambda x: -x['elapsed'])[:top]
+	patches = ', '.join(f'{x["name"]} {x["elapsed"]:.1f}s' + ('' if x['ok'] else ' (failed)') for x in slowest)
+	return f'phases: {phases}' + (f'\nslowest patches: {patches}' if patches else '')
+
+# one apk of a Patch All run, the process and log pane live as long as the queue window
+# tools is the toolset the command was built with, the output's fingerprint is taken from the same one
+class QueueJob:
+	def __init__(self,path,apk,command,status='queued',tools=None):
+		self.path = path
+		self.name = Path(path).name
+		self.apk = apk
+		self.command = command
+		self.status = status
+		self.tools = tools
+		self.process = None
+		self.started = None
+		self.finished = None
+		self.log = LogView()
+
+	def elapsed(self):
+		if self.started is None:
+			return 0.0
+		end = self.finished if self.finished is not None else time.monotonic()
+		return end - self.started
+
+class JobQueueWindow(QDialog):
+	jobFinished = QtCore.pyqtSignal(object)
+
+	def __init__(self,rev,jobs,parent=None):
+		super().__init__(parent)
+		self.rev = rev
+		self.jobs = jobs
+		self.paused = False
+		self.setWindowTitle('Patch All')
+		self.model = JobTableModel(jobs,self)
+		self.table = QtWidgets.QTableView()
+		self.table.setModel(self.model)
+		self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+		self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+		self.table.horizontalHeader().setSectionResizeMode(0,QHeaderView.Stretch)
+		self.table.selectionModel().currentRowChanged.connect(self.showLog)
+		self.logs = QtWidgets.QStackedWidget()
+		for job in jobs:
+			self.logs.addWidget(job.log)
+
+		self.workers = QtWidgets.QSpinBox()
+		self.workers.setPrefix('jobs: ')
+		self.workers.setRange(1,32)
+		self.workers.setValue(min(max(1,int(rev.settings.patchJobs)),self.workers.maximum()))
+		self.workers.valueChanged.connect(self.schedule)
+		self.pauseBtn = QPushButton('Pause')
+		self.pauseBtn.pressed.connect(self.togglePause)
+		self.cancelBtn = QPushButton('Cancel')
+		self.cancelBtn.pressed.connect(self.cancelSelected)
+		self.cancelAllBtn = QPushButton('Cancel All')
+		self.cancelAllBtn.pressed.connect(self.cancelAll)
+		self.retryBtn = QPushButton('Retry')
+		self.retryBtn.pressed.connect(self.retrySelected)
+		self.stats = QLabel()
+		self.progress = QProgressBar()
+		self.progress.setMaximum(len(jobs))
+
+		buttons = QtWidgets.QHBoxLayout()
+		for w in (self.workers,self.pauseBtn,self.cancelBtn,self.cancelAllBtn,self.retryBtn):
+			buttons.addWidget(w)
+		split = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+		split.addWidget(self.table)
+		split.addWidget(self.logs)
+		l = QVBoxLayout()
+		l.addWidget(self.progress)
+		l.addWidget(self.stats)
+		l.addWidget(split)
+		l.addLayout(buttons)
+		self.setLayout(l)
+		self.resize(800,600)
+
+		# elapsed times and the eta tick once a second, process output updates its own pane
+		self.timer = QtCore.QTimer(self)
+		self.timer.timeout.connect(self.tick)
+		self.timer.start(1000)
+		self.schedule()
+		self.tick()
+
+	def running(self):
+		return [x for x in self.jobs if x.status == 'running']
+
+	def schedule(self):
+		if self.paused: return
+		free = self.workers.value() - len(self.running())
+		for job in self.jobs:
+			if free <= 0: break
+			if job.status == 'queued':
+				self.startJob(job)
+				free -= 1
+
+	def startJob(self,job):
+		job.status = 'running'
+		job.started = time.monotonic()
+		job.finished = None
+		job.log.message(f'Executing {job.command}')
+		job.log.open(job.apk)
+		job.process = QtCore.QProcess(self)
+		job.process.readyReadStandardOutput.connect(lambda: self.readOutput(job))
+		job.process.readyReadStandardError.connect(lambda: self.readError(job))
+		job.process.finished.connect(lambda code,status: self.finishJob(job,code,status))
+		job.process.errorOccurred.connect(lambda error: self.processError(job,error))
+		job.process.start(job.command)
+		self.model.jobChanged(job)
+
+	def readOutput(self,job):
+		if job.process is None: return
+		job.log.feed(bytes(job.process.readAllStandardOutput()))
+
+	def readError(self,job):
+		if job.process is None: return
+		job.log.feed(bytes(job.process.readAllStandardError()),'stderr')
+
+	# a process that never starts does not emit finished
+	def processError(self,job,error):
+		if error == QtCore.QProcess.FailedToStart and job.status == 'running':
+			job.log.message(f'Could not start: {job.process.errorString()}')
+			self.finishJob(job,-1,QtCore.QProcess.CrashExit)
+
+	def finishJob(self,job,code,status):
+		if job.status != 'running': return
+		job.finished = time.monotonic()
+		job.status = 'done' if code == 0 and status == QtCore.QProcess.NormalExit else 'failed'
+		job.log.closeLog()
+		job.log.message(f'Process finished: {job.status} ({code}) in {job.elapsed():.1f}s')
+		if job.status == 'done':
+			try:
+				self.rev.manifest.record(job.apk.outputFile,self.rev.buildFingerprint(job.apk,job.tools),job.apk.path)
+			except OSError as e:
+				# the apk was moved or deleted while it was patched
+				job.log.message(f'Build not recorded: {e}')
+		job.process.deleteLater()
+		job.process = None
+		self.model.jobChanged(job)
+		self.jobFinished.emit(job)
+		self.schedule()
+		self.tick()
+
+	def selectedJob(self):
+		index = self.table.selectionModel().currentIndex()
+		return self.jobs[index.row()] if index.isValid() else None
+
+	def showLog(self,current,previous=None):
+		if current.isValid():
+			self.logs.setCurrentWidget(self.jobs[current.row()].log)
+
+	def togglePause(self):
+		self.paused = not self.paused
+		self.pauseBtn.setText('Resume' if self.paused else 'Pause')
+		self.schedule()
+		self.tick()
+
+	def cancelJob(self,job):
+		if job.status == 'queued':
+			job.status = 'cancelled'
+		elif job.status == 'running':
+			job.status = 'cancelled'
+			job.finished = time.monotonic()
+			job.process.kill()
+			job.process.waitForFinished(3000)
+			job.log.closeLog()
+			job.log.message('Cancelled')
+			job.process.deleteLater()
+			job.process = None
+		self.model.jobChanged(job)
+
+	def cancelSelected(self):
+		job = self.selectedJob()
+		if job is None: return
+		self.cancelJob(job)
+		self.schedule()
+		self.tick()
+
+	def cancelAll(self):
+		for job in self.jobs:
+			self.cancelJob(job)
+		self.tick()
+
+	def retrySelected(self):
+		job = self.selectedJob()
+		if job is None or job.status not in ('failed','cancelled'): return
+		job.status = 'queued'
+		job.started = None
+		job.finished = None
+		self.model.jobChanged(job)
+		self.schedule()
+		self.tick()
+
+	def tick(self):
+		self.model.timesChanged()
+		counts = {}
+		for job in self.jobs:
+			counts[job.status] = counts.get(job.status,0) + 1
+		finished = [x for x in self.jobs if x.status in ('done','failed') and x.finished is not None]
+		self.progress.setValue(len(self.jobs) - counts.get('queued',0) - counts.get('running',0))
+		text = ', '.join(f'{y} {x}' for x,y in counts.items())
+		if finished:
+			first = min(x.started for x in finished)
+			last = max(x.finished for x in finished)
+			if last > first:
+				text += f' | {len(finished) / (last - first) * 60:.1f} apks/min'
+			remaining = counts.get('queued',0) + counts.get('running',0)
+			if remaining and not self.paused:
+				average = sum(x.elapsed() for x in finished) / len(finished)
+				eta = remaining * average / self.workers.value()
+				text += f' | eta {int(eta // 60)}m{int(eta % 60):02d}s'
+		if self.paused:
+			text += ' | paused'
+		self.stats.setText(text)
+
+	def closeEvent(self,event):
+		self.cancelAll()
+		super().closeEvent(event)
+
 class OptionsDialog(QDialog):
 	
 	def __init__(self, patch):
@@ -118,7 +427,7 @@ class OptionsDialog(QDialog):
 		else:
 			super().reject()
 
-class ApkDetailView(QListWidget):
+class ApkDetailView(QtWidgets.QListView):
 	def __init__(self, parent=None):
 		super().__init__(parent)
 		self.parent = parent
@@ -126,14 +435,20 @@ class ApkDetailView(QListWidget):
 		self.apk = self.parent.apkdetails
 		self.selectedPatch = None
 		self.options = {}
+		self.patchModel = PatchListModel(self)
+		self.patchProxy = filterProxy(self.patchModel,self)
+		self.setModel(self.patchProxy)
+		self.setUniformItemSizes(True)
 		# Right Click Menu
 		self.doubleClicked.connect(self.set_Option)
-		self.itemClicked.connect(self.select)
+		self.clicked.connect(self.select)
 
-	def select(self,item):
-		self.selectedPatch = item
+	def select(self,index):
+		self.selectedPatch = self.patchProxy.mapToSource(index)
 
 	def loadDefaults(self):
+		# patches are shared between apps, so options edited for the last apk are cleared first
+		self.app.resetOptions()
 		if self.apk.options.exists():
 			opts = json.loads(self.apk.options.read_text())
 			for x in opts:
@@ -143,37 +458,79 @@ class ApkDetailView(QListWidget):
 					except:
 						continue
 
+	# check states and colors are worked out by the model as rows are painted
 	def loadList(self):
 		self.selectedPatch = None
-		self.clear()
 		self.loadDefaults()
-		for patch in self.app.patches.values():
-			item = QListWidgetItem(patch.name)
-			if patch.use:
-				item.setCheckState(2)
-			else:
-				item.setCheckState(0)
-			if patch.versions is not None and self.parent.apkdetails.version not in patch.versions:
-				item.setBackground( QColor('#880000') )
-				item.setCheckState(0)
-			if any(x for x in patch.options.values()):
-				item.setBackground( QColor('#000055') )
-			if any(x for x in patch.options.values() if x.required):
-				item.setBackground( QColor('#000088') )
-				if item.checkState() == 2:
-					item.setCheckState(1)
-			self.addItem(item)
-
-	def set_Option(self):
-		k = OptionsDialog(self.app.patches[self.selectedPatch.text()])
+		self.patchModel.load(self.app,self.apk)
+
+	# checked patches of the apk currently shown, None when the list belongs to another apk
+	# compared by path, a re-probe replaces the apk object of the same file
+	def checkedPatches(self,apk):
+		shown = self.patchModel.apk
+		if shown is None or apk is None or shown.path != apk.path:
+			return None
+		return self.patchModel.checkedNames()
+
+	def set_Option(self,index):
+		self.selectedPatch = self.patchProxy.mapToSource(index)
+		k = OptionsDialog(self.app.patches[self.patchModel.names[self.selectedPatch.row()]])
 		if k.exec_():
 			self.save_Options()
-			self.selectedPatch.setCheckState(2)
+			self.patchModel.setData(self.selectedPatch,QtCore.Qt.Checked,QtCore.Qt.CheckStateRole)
 		pass
   
 	def save_Options(self):	
 		json.dump(self.app.getOptions(),self.apk.options.open('w'))
 
+class ScanSignals(QtCore.QObject):
+	found = QtCore.pyqtSignal(int,int)
+	loaded = QtCore.pyqtSignal(int,object,object)
+	folders = QtCore.pyqtSignal(int,object)
+
+# probes one apk on the thread pool, a cancelled scan skips the work entirely
+class ApkProbeTask(QtCore.QRunnable):
+	def __init__(self,rev,path,generation,cancelled,signals):
+		super().__init__()
+		self.rev = rev
+		self.path = path
+		self.generation = generation
+		self.cancelled = cancelled
+		self.signals = signals
+
+	def run(self):
+		if self.cancelled.is_set(): return
+		try:
+			apk = self.rev.loadAPK(self.path)
+		except Exception:
+			apk = None
+		if not self.cancelled.is_set():
+			self.signals.loaded.emit(self.generation,self.path,apk)
+
+# lists the folder off the gui thread and queues a probe per apk as they are found
+class FolderScanTask(QtCore.QRunnable):
+	def __init__(self,rev,folder,generation,cancelled,signals,pool):
+		super().__init__()
+		self.rev = rev
+		self.folder = folder
+		self.generation = generation
+		self.cancelled = cancelled
+		self.signals = signals
+		self.pool = pool
+
+	def run(self):
+		count = 0
+		folders = []
+		for root, dirs, files in os.walk(self.folder):
+			folders.append(root)
+			for name in files:
+				if not name.endswith('.apk'): continue
+				if self.cancelled.is_set(): return
+				self.pool.start(ApkProbeTask(self.rev,Path(root) / name,self.generation,self.cancelled,self.signals))
+				count += 1
+		self.signals.folders.emit(self.generation,folders)
+		self.signals.found.emit(self.generation,count)
+
 class ApkListView(QWidget):
 	def __init__(self, folder,parent=None):
 		super().__init__(parent)
@@ -189,12 +546,39 @@ class ApkListView(QWidget):
 
 		self.apks = {}
 		self.apps = {}
+		self.pool = QtCore.QThreadPool.globalInstance()
+		self.generation = 0
+		self.cancelled = threading.Event()
+		self.scanSignals = ScanSignals()
+		self.scanSignals.found.connect(self.scanFound)
+		self.scanSignals.loaded.connect(self.addApk)
+		self.scanSignals.folders.connect(self.watchFolders)
+		# size and mtime of every apk seen, changes to the folder only probe apks that differ from these
+		self.known = {}
+		self.pendingFolders = set()
+		self.pendingFiles = set()
+		self.watcher = QtCore.QFileSystemWatcher(self)
+		self.watcher.directoryChanged.connect(self.folderChanged)
+		self.watcher.fileChanged.connect(self.fileChanged)
+		# copies and renames come in bursts of events, they are applied together once the folder is quiet
+		self.debounce = QtCore.QTimer(self)
+		self.debounce.setSingleShot(True)
+		self.debounce.setInterval(750)
+		self.debounce.timeout.connect(self.applyChanges)
+		self.watchSignals = ScanSignals()
+		self.watchSignals.loaded.connect(self.updateApk)
 		self.loadTable()
 
 		# Right Click Menu
 
 	def loadTable(self):
-		self.apkTable = QTableWidget()
+		self.apkModel = ApkTableModel(self)
+		self.apkProxy = filterProxy(self.apkModel,self)
+		self.apkTable = QtWidgets.QTableView()
+		self.apkTable.setModel(self.apkProxy)
+		self.apkTable.setSortingEnabled(True)
+		self.apkTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+		self.apkTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
 		self.apkTable.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
 		self.apkTable.customContextMenuRequested.connect(self.right_menu)
 		self.apkTable.verticalHeader().hide()
@@ -205,71 +589,187 @@ class ApkListView(QWidget):
 		self.commandBtn.setText('Show Command')
 		self.runBtn = QPushButton()
 		self.runBtn.setText("Run Command")
+		# the view is rebuilt when the toolset event arrives, until then there is nothing to run
+		for btn in (self.commandBtn,self.runBtn):
+			btn.setEnabled(self.parent.rev.toolset.complete)
 		self.saveBtn = QPushButton()
 		self.saveBtn.setText('Save Patches')
   
-		self.apklist = list(self.folder.rglob('*.apk'))
+		self.scanProgress = QProgressBar()
+		self.scanProgress.setFormat('Scanning apks %v/%m')
+		self.apkFilter = QLineEdit()
+		self.apkFilter.setPlaceholderText('Filter apks')
+		self.apkFilter.textChanged.connect(self.apkProxy.setFilterFixedString)
+		self.patchFilter = QLineEdit()
+		self.patchFilter.setPlaceholderText('Filter patches')
+		self.patchFilter.textChanged.connect(self.apkpatches.patchProxy.setFilterFixedString)
 
-		self.apkTable.setRowCount(len(self.apklist))
-		self.apkTable.setColumnCount(4)
-		self.apkTable.setHorizontalHeaderLabels(['name','version','update','output'])
 		self.apkTable.setColumnWidth(3,10)
-		count =0
-		for apk in self.apklist:
-			apkinfo = self.parent.rev.loadAPK(apk)
-			if apkinfo is None: continue
-			self.apks[apk.as_posix()] = apkinfo
-			self.apps[apk.as_posix()] = self.parent.rev.getApkPatches(apkinfo.name)
-
-			self.apkTable.setItem(count,0, QTableWidgetItem(apk.as_posix())) 
-			self.apkTable.setItem(count,1, QTableWidgetItem(apkinfo.version)) 
-			self.apkTable.setItem(count,2, QTableWidgetItem(self.apps[apk.as_posix()].getLatest()))
-			dld = QTableWidgetItem(str(apkinfo.outputFile))
-			if apkinfo.outputFile.exists():
-				dld.setBackground(QColor('#005500'))
-			self.apkTable.setItem(count,3, dld)
-
-			count+=1
 		# self.apkTable.horizontalHeader().setStretchLastSection(True) 
 		self.apkTable.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch) 
-		self.apkTable.resizeColumnsToContents()
   
+		self.layout.addWidget(self.apkFilter,0,1,1,2)
+		self.layout.addWidget(self.scanProgress,0,3,1,1)
 		self.layout.addWidget(self.apkTable,1,1,1,3)
-		self.layout.addWidget(self.commandText,2,1,1,1)
-		self.layout.addWidget(self.apkpatches,2,2,1,2)
+		self.layout.addWidget(self.commandText,2,1,2,1)
+		self.layout.addWidget(self.patchFilter,2,2,1,2)
+		self.layout.addWidget(self.apkpatches,3,2,1,2)
   
-		self.layout.addWidget(self.commandBtn,3,1,1,1)
-		self.layout.addWidget(self.runBtn,3,2,1,1)
-		self.layout.addWidget(self.saveBtn,3,3,1,1)
+		self.layout.addWidget(self.commandBtn,4,1,1,1)
+		self.layout.addWidget(self.runBtn,4,2,1,1)
+		self.layout.addWidget(self.saveBtn,4,3,1,1)
 
-		self.apkTable.itemClicked.connect(self.tableSelections)
+		self.apkTable.clicked.connect(self.tableSelections)
 		# self.apkTable.
 		self.commandBtn.clicked.connect(self.command)
 		self.saveBtn.clicked.connect(self.savePatches)
 		self.runBtn.clicked.connect(self.runCommand)
 		self.apkTable.clicked.connect(self.loadAPKPatches)
 		self.apkTable.doubleClicked.connect(self.openMirror)
+		self.scan()
+
+	# rows are added as each apk's metadata arrives, the table is usable while the scan runs
+	def scan(self):
+		self.cancelScan()
+		self.generation += 1
+		self.cancelled = threading.Event()
+		self.scanned = 0
+		self.scanTotal = None
+		self.scanProgress.setRange(0,0)
+		self.scanProgress.setValue(0)
+		self.scanProgress.show()
+		self.pool.start(FolderScanTask(self.parent.rev,self.folder,self.generation,self.cancelled,self.scanSignals,self.pool))
+
+	def cancelScan(self):
+		self.cancelled.set()
+		self.debounce.stop()
+
+	def scanFound(self,generation,count):
+		if generation != self.generation: return
+		self.scanTotal = count
+		self.scanProgress.setRange(0,count)
+		self.scanProgress.setValue(self.scanned)
+		self.scanFinished()
+
+	def addApk(self,generation,path,apkinfo):
+		if generation != self.generation: return
+		self.scanned += 1
+		if self.scanTotal is not None:
+			self.scanProgress.setValue(self.scanned)
+		self.known.setdefault(path.as_posix(),fileStat(path))
+		if apkinfo is not None:
+			self.apks[path.as_posix()] = apkinfo
+			self.apps[path.as_posix()] = self.parent.rev.getApkPatches(apkinfo.name)
+			self.apkModel.addApk(path.as_posix(),apkinfo,self.apps[path.as_posix()])
+		self.scanFinished()
+
+	def scanFinished(self):
+		if self.scanTotal is None or self.scanned < self.scanTotal: return
+		self.scanProgress.hide()
+		self.parent.rev.apkcache.save()
+		self.watcher.addPaths([x for x in self.known if x not in self.watcher.files()])
+
+	def watchFolders(self,generation,folders):
+		if generation != self.generation: return
+		watched = set(self.watcher.directories())
+		missing = [x for x in folders if Path(x).as_posix() not in watched]
+		if missing:
+			self.watcher.addPaths(missing)
+
+	def folderChanged(self,path):
+		self.pendingFolders.add(Path(path))
+		self.debounce.start()
+
+	def fileChanged(self,path):
+		self.pendingFiles.add(path)
+		self.debounce.start()
+
+	# only the changed folders are listed again, apks whose size and mtime are unchanged keep their row
+	def applyChanges(self):
+		folders, self.pendingFolders = self.pendingFolders, set()
+		files, self.pendingFiles = self.pendingFiles, set()
+		# a change in a folder covers everything below it
+		folders = [x for x in folders if not any(y != x and x.is_relative_to(y) for y in folders)]
+		current = {}
+		newFolders = []
+		for folder in folders:
+			for root, dirs, names in os.walk(folder):
+				newFolders.append(root)
+				for name in names:
+					if name.endswith('.apk'):
+						path = (Path(root) / name).as_posix()
+						current[path] = fileStat(path)
+		for path in files:
+			if Path(path).is_file():
+				current[path] = fileStat(path)
+		removed = [x for x in self.known if x not in current and (x in files or any(Path(x).is_relative_to(y) for y in folders))]
+		for path in removed:
+			self.removeApk(path)
+		changed = [x for x,y in current.items() if y is not None and self.known.get(x) != y]
+		for path in changed:
+			self.known[path] = current[path]
+			self.pool.start(ApkProbeTask(self.parent.rev,Path(path),self.generation,self.cancelled,self.watchSignals))
+		self.watchFolders(self.generation,newFolders)
+		if changed:
+			self.watcher.addPaths([x for x in changed if x not in self.watcher.files()])
+
+	def updateApk(self,generation,path,apkinfo):
+		if generation != self.generation: return
+		path = path.as_posix()
+		if apkinfo is None:
+			# unreadable for now, most likely still being copied, a later change probes it again
+			self.dropRow(path)
+		else:
+			self.apks[path] = apkinfo
+			self.apps[path] = self.parent.rev.getApkPatches(apkinfo.name)
+			self.apkModel.addApk(path,apkinfo,self.apps[path])
+			if path == self.selectedAPK:
+				shown = self.apkpatches.patchModel.apk
+				self.selectPath(path)
+				# the patch list keeps its unsaved checks for the re-probed apk, it is only rebuilt for another package or version
+				if shown is not None and (shown.name,shown.version) == (apkinfo.name,apkinfo.version):
+					self.apkpatches.apk = self.apkpatches.patchModel.apk = apkinfo
+				elif shown is not None:
+					self.loadAPKPatches()
+		self.parent.rev.apkcache.save()
+
+	def removeApk(self,path):
+		self.known.pop(path,None)
+		self.dropRow(path)
+
+	def dropRow(self,path):
+		self.apks.pop(path,None)
+		self.apps.pop(path,None)
+		self.apkModel.removeApk(path)
+		if path == self.selectedAPK:
+			self.selectedAPK = None
+			self.selectedAPKtext = None
+			self.apkdetails = None
+			self.app = None
+			self.apkpatches.patchModel.load(None,None)
+			self.commandText.clear()
 
 	def tableSelections(self,selection):
-		self.selectedAPK = self.apkTable.item(selection.row(), 0)
-		self.selectedAPKtext = self.selectedAPK.text()
-		self.apkdetails = self.apks[self.selectedAPKtext]
-		self.app = self.apps[self.selectedAPKtext]
+		self.selectPath(self.apkProxy.data(selection,QtCore.Qt.UserRole))
+
+	def selectPath(self,path):
+		self.selectedAPK = path
+		self.selectedAPKtext = path
+		self.apkdetails = self.apks[path]
+		self.app = self.apps[path]
 
 	def savePatches(self):
 		if self.selectedAPK is None: return
-		checked_items = []
-		for index in range(self.apkpatches.count()):
-			if self.apkpatches.item(index).checkState() == QtCore.Qt.Checked:
-				checked_items.append(self.apkpatches.item(index).text())
-		if len(checked_items) > 0:
+		checked_items = self.apkpatches.checkedPatches(self.apkdetails)
+		if checked_items:
 			json.dump(checked_items,self.apkdetails.patches.open('w'))
 
 	def runCommand(self,auto=False):
 		if self.selectedAPK is None: return
 		command = self.command()
 		if not command.startswith('ERROR:'):
-			self.term = ProcessWindow(self.selectedAPKtext,command,auto)
+			self.parent.rev.startCDSBuild()
+			self.term = ProcessWindow(self.selectedAPKtext,command,auto,apk=self.apkdetails,expected=self.parent.rev.expectedPatches(self.apkdetails))
 			self.term.exec_()
 			pass
 
@@ -306,8 +806,16 @@ class ApkListView(QWidget):
 		menu.exec_(self.mapToGlobal(pos))
 
 	def normalize(self):
+		if self.selectedAPK is None: return
+		old = self.selectedAPK
 		if self.apkdetails.normalizeName():
-			self.selectedAPK.setText(self.apkdetails.path.as_posix())
+			new = self.apkdetails.path.as_posix()
+			self.parent.rev.apkcache.move(old,new)
+			self.known[new] = self.known.pop(old,None) or fileStat(new)
+			self.apks[new] = self.apks.pop(old)
+			self.apps[new] = self.apps.pop(old)
+			self.apkModel.renameApk(old,new)
+			self.selectPath(new)
 
 class ApksWindow(QDialog):
 
@@ -315,34 +823,27 @@ class ApksWindow(QDialog):
 		super().__init__(parent)
 		self.organizer = QtWidgets.QVBoxLayout()
 		self.setLayout(self.organizer)
-		self.apkTable = QTableWidget()
+		self.apks = {x:y for x,y in parent.rev.apps.items() if y.name != 'General Apps'}
+		self.appModel = AppTableModel(list(self.apks.values()),self)
+		self.appProxy = filterProxy(self.appModel,self)
+		self.apkFilter = QLineEdit()
+		self.apkFilter.setPlaceholderText('Filter apps')
+		self.apkFilter.textChanged.connect(self.appProxy.setFilterFixedString)
+		self.apkTable = QtWidgets.QTableView()
+		self.apkTable.setModel(self.appProxy)
+		self.apkTable.setSortingEnabled(True)
+		self.apkTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
 		# self.apkTable.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
 		# self.apkTable.customContextMenuRequested.connect(self.right_menu)
 		self.apkTable.verticalHeader().hide()	
-		self.apkTable.setRowCount(len(parent.rev.apps)-1)
-		self.apkTable.setColumnCount(2)
-		self.apkTable.setHorizontalHeaderLabels(['name','version'])
-		self.apkTable.setColumnWidth(3,10)
-		self.apks = {x:y for x,y in parent.rev.apps.items() if y.name != 'General Apps'}
-		count = 0
-		for apk in self.apks.values():
-
-			self.apkTable.setItem(count,0, QTableWidgetItem(apk.name)) 
-			self.apkTable.setItem(count,1, QTableWidgetItem(apk.getLatest()))
-			# dld = QTableWidgetItem(str(apkinfo.outputFile))
-			# if apkinfo.outputFile.exists():
-			# 	dld.setBackground(QColor('#005500'))
-			# self.apkTable.setItem(count,3, dld)
-
-			count+=1
 		self.apkTable.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch) 
-		self.apkTable.resizeColumnsToContents()
+		self.organizer.addWidget(self.apkFilter)
 		self.organizer.addWidget(self.apkTable)
 		self.apkTable.doubleClicked.connect(self.openMirror)
 
 	def openMirror(self,selection):
-		self.selectedAPK = self.apks[self.apkTable.item(selection.row(), 0).text()]
-		version = self.apkTable.item(selection.row(), 1).text()
+		self.selectedAPK = self.apks[self.appProxy.data(selection,QtCore.Qt.UserRole)]
+		version = self.appProxy.data(selection.siblingAtColumn(1))
 		q = self.selectedAPK.name
 		if version != 'Latest':
 			q += ' '+version
@@ -351,9 +852,15 @@ class ApksWindow(QDialog):
 		pass
 
 class MainWindow(QMainWindow):
+	# Revanced emits from its refresh thread, the signal brings the event back to the gui thread
+	toolEvent = QtCore.pyqtSignal(str,dict)
+
 	def __init__(self, parent=None):
 		super(MainWindow, self).__init__(parent)
-		self.rev = Revanced()
+		# show the tools and patches already on disk right away, updates are checked in the background
+		self.rev = Revanced(refresh=False)
+		self.toolEvent.connect(self.handleToolEvent)
+		self.rev.addListener(self.toolEvent.emit)
 
 		# self.setGeometry(1000, 1000, 300, 300)
 		self.folder = self.rev.settings.apkFolder
@@ -378,8 +885,10 @@ class MainWindow(QMainWindow):
 		view_menu = menu_bar.addMenu("View")
 
 		# Add actions to view menu
-		patch_action = QtWidgets.QAction("Patch All", self)
+		patch_action = self.patchAction = QtWidgets.QAction("Patch All", self)
+		patch_action.setEnabled(self.rev.toolset.complete)
 		load_action = QtWidgets.QAction("ReLoad", self)
+		purge_action = QtWidgets.QAction("Purge APK Cache", self)
 		folder_action = QtWidgets.QAction("Select Folder", self)
 		toggle_action = QtWidgets.QAction("Toggle Layout", self)
 		patches_action = QtWidgets.QAction("Show Apks", self)
@@ -388,6 +897,7 @@ class MainWindow(QMainWindow):
 		view_menu.addAction(patch_action)
 		view_menu.addAction(folder_action)
 		view_menu.addAction(load_action)
+		view_menu.addAction(purge_action)
 		view_menu.addAction(toggle_action)
 		view_menu.addAction(patches_action)
 		view_menu.addAction(close_action)
@@ -397,10 +907,25 @@ class MainWindow(QMainWindow):
 		folder_action.triggered.connect(self.selectFolder)
 		close_action.triggered.connect(sys.exit)
 		load_action.triggered.connect(self.reload)
+		purge_action.triggered.connect(self.purgeCache)
 
 		self.setWindowTitle("ReVancedGEN")
 		self.startView()
 		self.show()
+		self.rev.startRefresh()
+
+	def handleToolEvent(self,event,data):
+		if event == 'refresh' and data['state'] == 'checking':
+			self.statusBar().showMessage('Checking for tool updates...')
+		elif event == 'download':
+			self.statusBar().showMessage(f"Downloading tools {data['done']}/{data['total']}: {data['name']}")
+		elif event == 'refresh' and data['state'] == 'failed':
+			self.statusBar().showMessage(f"Tool update failed: {data['error']}",10000)
+		elif event == 'refresh' and data['state'] == 'done':
+			self.statusBar().showMessage('Tools updated' if data['changed'] else 'Tools up to date',5000)
+		elif event == 'toolset':
+			self.patchAction.setEnabled(data['toolset'].complete)
+			self.reload()
 
 	def apks(self):
 		self.ws = ApksWindow(self)
@@ -408,34 +933,59 @@ class MainWindow(QMainWindow):
 		self.ws.show()
 
 	def patchAll(self):
-		sz = self.lsv.apkTable.rowCount()
-		progress = QProgressBar(self)
-		progress.setMinimum(0)
-		progress.setMaximum(sz)
-		self.rn = ProcessWindow('','',progress=progress)
-		self.rn.auto = True
-		self.rn.setWindowModality(QtCore.Qt.ApplicationModal)
-		for row in range(sz):
-			_item = self.lsv.apkTable.item(row, 0)
-			self.lsv.tableSelections(_item)
-			command = self.lsv.command()
-			if not command.startswith('ERROR:'):
-				self.rn.command = command
-				self.rn.start_process()
-				self.rn.show()
-			self.rn.progress.setValue(row)
+		self.lsv.savePatches()
+		# the whole queue uses the tools present now, like run(), even if a refresh swaps in new ones meanwhile
+		tools = self.rev.toolset
+		rows = [self.lsv.apkModel.row(x) for x in range(self.lsv.apkModel.rowCount())]
+		duplicates = self.rev.findDuplicates([x[0] for x in rows])
+		superseded = {} if self.rev.settings.patchAllVersions else self.rev.findSuperseded([x[0] for x in rows if Path(x[0]) not in duplicates],tools)
+		jobs = []
+		for path, apk, _ in rows:
+			if Path(path) in duplicates:
+				job = QueueJob(path,apk,'','duplicate')
+				job.log.message(f'Same apk as {duplicates[Path(path)].as_posix()}, only that one is patched')
+				jobs.append(job)
+				continue
+			if Path(path) in superseded:
+				job = QueueJob(path,apk,'','superseded')
+				job.log.message(f'{superseded[Path(path)].as_posix()} is the version of {apk.name} that is patched')
+				jobs.append(job)
+				continue
+			current = False
+			try:
+				command = self.rev.getPatchCommand(apk,tools)
+				current = not command.startswith('ERROR:') and self.rev.manifest.isCurrent(apk.outputFile,self.rev.buildFingerprint(apk,tools))
+			except Exception as e:
+				command = f'ERROR: {e}'
+			job = QueueJob(path,apk,command,tools=tools)
+			if command.startswith('ERROR:'):
+				job.status = 'skipped'
+				job.log.message(command)
+			elif current:
+				job.status = 'uptodate'
+				job.log.message(f'{apk.outputFile.as_posix()} is already built from this apk, selection and tools')
+			jobs.append(job)
+		if any(x.status == 'queued' for x in jobs):
+			self.rev.startCDSBuild()
+		self.queue = JobQueueWindow(self.rev,jobs,self)
+		self.queue.jobFinished.connect(lambda job: self.lsv.apkModel.refreshOutputs())
+		self.queue.show()
 
 	def startView(self):
+		if self.centerW is not None:
+			self.centerW.cancelScan()
 		self.lsv = ApkListView(self.folder,self)
 		self.centerW = self.lsv
 		self.setCentralWidget(self.centerW)
 
 	def reload(self):
-		spinner = WaitingSpinner(self, True, True)
-		spinner.start()
+		self.rev.keystores.invalidate()
 		self.startView()
-		spinner.stop()
   
+	def purgeCache(self):
+		self.rev.apkcache.purge()
+		self.reload()
+
 	def selectFolder(self):
 		dialog = QFileDialog()
 		dialog.setFileMode(QFileDialog.DirectoryOnly)
@@ -449,8 +999,10 @@ class MainWindow(QMainWindow):
 
 if __name__ == '__main__':
 	if len(sys.argv)>1:
-		rev = Revanced()
-		rev.run()
+		rev = Revanced(refresh=False)
+		rev.startRefresh()
+		if rev.toolset.complete or rev.waitForTools():
+			rev.run()
 	app = QApplication(sys.argv)
 	app.setStyleSheet(qdarkstyle.load_stylesheet())
 	w = MainWindow()
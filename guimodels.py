@@ -0,0 +1,273 @@
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from settings import versionKey
+
+# models behind the gui tables, cells are only computed when a view asks for them
+
+# what a column sorts by when that is not its text, e.g. versionKey for version columns so 9.0 sorts below 18.45.43
+SortRole = Qt.UserRole + 1
+
+class ApkTableModel(QtCore.QAbstractTableModel):
+	headers = ['name','version','update','output']
+
+	def __init__(self,parent=None):
+		super().__init__(parent)
+		self.rows = []
+		self.index_ = {}
+		# output exists / latest version are filled the first time a row is painted
+		self.outputs = {}
+		self.latest = {}
+
+	def rowCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.rows)
+
+	def columnCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.headers)
+
+	def headerData(self,section,orientation,role=Qt.DisplayRole):
+		if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+			return self.headers[section]
+		return None
+
+	def data(self,index,role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		path, apk, app = self.rows[index.row()]
+		column = index.column()
+		if role == Qt.DisplayRole:
+			if column == 0:
+				return path
+			if column == 1:
+				return apk.version
+			if column == 2:
+				if path not in self.latest:
+					self.latest[path] = app.getLatest()
+				return self.latest[path]
+			if column == 3:
+				return str(apk.outputFile)
+		elif role == Qt.BackgroundRole and column == 1:
+			# older than the version the patches are made for, or newer than anything they name
+			state = app.catalog.compareTarget(app.package,apk.version)
+			if state == -1:
+				return QColor('#555500')
+			if state == 1:
+				return QColor('#880000')
+		elif role == Qt.BackgroundRole and column == 3:
+			if path not in self.outputs:
+				self.outputs[path] = apk.outputFile.exists()
+			if self.outputs[path]:
+				return QColor('#005500')
+		elif role == Qt.UserRole:
+			return path
+		elif role == SortRole and column in (1,2):
+			return versionKey(self.data(index))
+		return None
+
+	def addApk(self,path,apk,app):
+		if path in self.index_:
+			self.updateApk(path,apk,app)
+			return
+		row = len(self.rows)
+		self.beginInsertRows(QtCore.QModelIndex(),row,row)
+		self.rows.append((path,apk,app))
+		self.index_[path] = row
+		self.endInsertRows()
+
+	def updateApk(self,path,apk,app):
+		row = self.index_[path]
+		self.rows[row] = (path,apk,app)
+		self.outputs.pop(path,None)
+		self.latest.pop(path,None)
+		self.dataChanged.emit(self.index(row,0),self.index(row,len(self.headers)-1))
+
+	def renameApk(self,old,new):
+		row = self.index_.pop(old)
+		_, apk, app = self.rows[row]
+		self.rows[row] = (new,apk,app)
+		self.index_[new] = row
+		self.outputs.pop(old,None)
+		self.latest.pop(old,None)
+		self.dataChanged.emit(self.index(row,0),self.index(row,len(self.headers)-1))
+
+	def removeApk(self,path):
+		row = self.index_.get(path)
+		if row is None: return
+		self.beginRemoveRows(QtCore.QModelIndex(),row,row)
+		del self.rows[row]
+		self.index_ = {x[0]:i for i,x in enumerate(self.rows)}
+		self.outputs.pop(path,None)
+		self.latest.pop(path,None)
+		self.endRemoveRows()
+
+	# output files are written by patch jobs, so their highlight is looked up again
+	def refreshOutputs(self):
+		self.outputs = {}
+		if self.rows:
+			self.dataChanged.emit(self.index(0,3),self.index(len(self.rows)-1,3),[Qt.BackgroundRole])
+
+	def row(self,row):
+		return self.rows[row]
+
+class PatchListModel(QtCore.QAbstractListModel):
+	def __init__(self,parent=None):
+		super().__init__(parent)
+		self.app = None
+		self.apk = None
+		self.names = []
+		self.checks = {}
+		self.colors = {}
+
+	def load(self,app,apk):
+		self.beginResetModel()
+		self.app = app
+		self.apk = apk
+		self.names = list(app.patches) if app is not None else []
+		self.checks = {}
+		self.colors = {}
+		self.endResetModel()
+
+	def rowCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.names)
+
+	# same rules the list always used: red for the wrong version, blue for options, bright blue for required ones
+	def _style(self,name):
+		if name not in self.colors:
+			patch = self.app.patches[name]
+			color = None
+			check = Qt.Checked if patch.use else Qt.Unchecked
+			if not self.app.isCompatible(patch,self.apk.version):
+				color = QColor('#880000')
+				check = Qt.Unchecked
+			if any(x for x in patch.options.values()):
+				color = QColor('#000055')
+			if any(x for x in patch.options.values() if x.required):
+				color = QColor('#000088')
+				if check == Qt.Checked:
+					check = Qt.PartiallyChecked
+			self.colors[name] = color
+			self.checks.setdefault(name,check)
+		return self.colors[name]
+
+	def checkState(self,row):
+		name = self.names[row]
+		if name not in self.checks:
+			self._style(name)
+		return self.checks[name]
+
+	def data(self,index,role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		name = self.names[index.row()]
+		if role == Qt.DisplayRole:
+			return name
+		if role == Qt.CheckStateRole:
+			return self.checkState(index.row())
+		if role == Qt.BackgroundRole:
+			return self._style(name)
+		return None
+
+	def flags(self,index):
+		if not index.isValid():
+			return Qt.NoItemFlags
+		return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+	def setData(self,index,value,role=Qt.EditRole):
+		if role != Qt.CheckStateRole or not index.isValid():
+			return False
+		self._style(self.names[index.row()])
+		self.checks[self.names[index.row()]] = Qt.CheckState(value)
+		self.dataChanged.emit(index,index,[Qt.CheckStateRole])
+		return True
+
+	def checkedNames(self):
+		return [x for i,x in enumerate(self.names) if self.checkState(i) == Qt.Checked]
+
+class AppTableModel(QtCore.QAbstractTableModel):
+	headers = ['name','version']
+
+	def __init__(self,apps,parent=None):
+		super().__init__(parent)
+		self.apps = apps
+		self.latest = {}
+
+	def rowCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.apps)
+
+	def columnCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.headers)
+
+	def headerData(self,section,orientation,role=Qt.DisplayRole):
+		if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+			return self.headers[section]
+		return None
+
+	def data(self,index,role=Qt.DisplayRole):
+		if not index.isValid() or role not in (Qt.DisplayRole,Qt.UserRole,SortRole):
+			return None
+		app = self.apps[index.row()]
+		if role == Qt.UserRole or index.column() == 0:
+			return None if role == SortRole else app.name
+		if app.name not in self.latest:
+			self.latest[app.name] = app.getLatest()
+		if role == SortRole:
+			return versionKey(self.latest[app.name])
+		return self.latest[app.name]
+
+# columns with a SortRole value sort by it, Qt cannot compare python tuples itself, the rest by their text
+class SortFilterProxy(QtCore.QSortFilterProxyModel):
+	def lessThan(self,left,right):
+		a, b = left.data(SortRole), right.data(SortRole)
+		if a is None or b is None:
+			return super().lessThan(left,right)
+		return a < b
+
+# sorts and filters on the text in any column
+def filterProxy(model,parent=None):
+	proxy = SortFilterProxy(parent)
+	proxy.setSourceModel(model)
+	proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+	proxy.setFilterKeyColumn(-1)
+	return proxy
+
+class JobTableModel(QtCore.QAbstractTableModel):
+	headers = ['apk','status','time']
+	colors = {'running':'#000088','done':'#005500','failed':'#880000','cancelled':'#555555','skipped':'#555555','uptodate':'#555555','duplicate':'#555555','superseded':'#555555'}
+
+	def __init__(self,jobs,parent=None):
+		super().__init__(parent)
+		self.jobs = jobs
+
+	def rowCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.jobs)
+
+	def columnCount(self,parent=QtCore.QModelIndex()):
+		return 0 if parent.isValid() else len(self.headers)
+
+	def headerData(self,section,orientation,role=Qt.DisplayRole):
+		if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+			return self.headers[section]
+		return None
+
+	def data(self,index,role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		job = self.jobs[index.row()]
+		if role == Qt.DisplayRole:
+			if index.column() == 0:
+				return job.name
+			if index.column() == 1:
+				return job.status
+			if index.column() == 2:
+				return f'{job.elapsed():.0f}s' if job.started is not None else ''
+		elif role == Qt.BackgroundRole and job.status in self.colors:
+			return QColor(self.colors[job.status])
+		return None
+
+	def jobChanged(self,job):
+		row = self.jobs.index(job)
+		self.dataChanged.emit(self.index(row,0),self.index(row,len(self.headers)-1))
+
+	def timesChanged(self):
+		if self.jobs:
+			self.dataChanged.emit(self.index(0,2),self.index(len(self.jobs)-1,2),[Qt.DisplayRole])
@@ -0,0 +1,73 @@
+from pathlib import Path
+import bisect
+import threading
+
+# keystore file name -> path for the output folder, so a keystore is found by app title without walking the folder
+# the folder is listed once, keystores revanced-cli creates later are added as their jobs finish
+class KeystoreRegistry:
+	def __init__(self,folder:Path):
+		self.folder = Path(folder)
+		self.lock = threading.Lock()
+		self.paths = None
+		self.names = []
+		self.titles = {}
+
+	def load(self):
+		paths = {}
+		for path in sorted(self.folder.rglob('*.keystore')):
+			paths.setdefault(path.name,path)
+		with self.lock:
+			self.paths = paths
+			self.names = sorted(paths)
+			self.titles = {}
+
+	# the next lookup lists the folder again
+	def invalidate(self):
+		with self.lock:
+			self.paths = None
+
+	def add(self,path):
+		path = Path(path)
+		with self.lock:
+			if self.paths is not None and path.name not in self.paths:
+				self.paths[path.name] = path
+				bisect.insort(self.names,path.name)
+				self.titles = {}
+
+	def _find(self,title):
+		prefix = f'Revanced-{title}'
+		path = self.paths.get(prefix + '.keystore')
+		if path is None:
+			start = bisect.bisect_left(self.names,prefix)
+			matches = []
+			for name in self.names[start:]:
+				if not name.startswith(prefix): break
+				matches.append(name)
+			path = self.paths[matches[-1]] if matches else None
+		return path
+
+	# Revanced-<title>.keystore, else the last Revanced-<title>*.keystore like the folder search used to pick
+	def find(self,title):
+		if self.paths is None:
+			self.load()
+		with self.lock:
+			if title not in self.titles:
+				self.titles[title] = self._find(title)
+			path = self.titles[title]
+		if path is not None and path.exists():
+			return path
+		if path is not None:
+			# deleted since the folder was listed
+			self.load()
+			with self.lock:
+				path = self.titles[title] = self._find(title)
+			return path
+		# put there by hand since the folder was listed
+		if self.default(title).exists():
+			self.add(self.default(title))
+			return self.default(title)
+		return None
+
+	# where revanced-cli creates the keystore of an app that has none yet
+	def default(self,title):
+		return self.folder / f'Revanced-{title}.keystore'
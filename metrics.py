@@ -0,0 +1,141 @@
+from pathlib import Path
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# time spent per stage (tool check, downloads, apk probing, catalog load, commands, revanced-cli) and a few counters
+# spans only add to running totals, so timing a stage costs two clock reads and a lock
+class Metrics:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			self.started = time.time()
+			self.stages = {}
+			self.counters = {}
+			self.phases = {}
+			self.patches = {}
+
+	@contextmanager
+	def span(self,stage):
+		start = time.perf_counter()
+		failed = False
+		try:
+			yield
+		except BaseException:
+			failed = True
+			raise
+		finally:
+			self.record(stage,time.perf_counter() - start,failed)
+
+	def record(self,stage,seconds,failed=False):
+		with self.lock:
+			entry = self.stages.get(stage)
+			if entry is None:
+				entry = self.stages[stage] = {'count':0,'failed':0,'total':0.0,'min':seconds,'max':seconds}
+			entry['count'] += 1
+			entry['failed'] += failed
+			entry['total'] += seconds
+			entry['min'] = min(entry['min'],seconds)
+			entry['max'] = max(entry['max'],seconds)
+
+	def add(self,counter,value=1):
+		with self.lock:
+			self.counters[counter] = self.counters.get(counter,0) + value
+
+	# adds one revanced-cli run's phases and patches to the totals of the run
+	def profile(self,profile):
+		with self.lock:
+			for phase, seconds in profile['phases'].items():
+				self.phases[phase] = self.phases.get(phase,0.0) + seconds
+			for patch in profile['patches']:
+				entry = self.patches.get(patch['name'])
+				if entry is None:
+					entry = self.patches[patch['name']] = {'count':0,'failed':0,'total':0.0,'max':0.0}
+				entry['count'] += 1
+				entry['failed'] += not patch['ok']
+				entry['total'] += patch['elapsed']
+				entry['max'] = max(entry['max'],patch['elapsed'])
+
+	def report(self,jobs=()):
+		with self.lock:
+			stages = {x:y | {'mean':y['total'] / y['count']} for x,y in self.stages.items()}
+			counters = dict(self.counters)
+			phases = dict(self.phases)
+			patches = dict(sorted(self.patches.items(),key=lambda x: -x[1]['total']))
+			started = self.started
+		finished = time.time()
+		report = {
+			'started':datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M:%S'),
+			'finished':datetime.fromtimestamp(finished).strftime('%Y-%m-%d %H:%M:%S'),
+			'duration':finished - started,
+			'stages':stages,
+			'counters':counters,
+			# revanced-cli time by phase and by patch, slowest patches first
+			'phases':phases,
+			'patches':patches,
+			'jobs':[{
+				'apk':str(x.apkpath),
+				'status':x.status,
+				'elapsed':x.elapsed,
+				'returncode':x.returncode,
+				'peakRss':x.peakRss,
+				'phases':x.profile['phases'] if x.profile else None,
+				'error':x.error
+			} for x in jobs]
+		}
+		return report
+
+# one json file per run, only the newest keep are left in the folder
+def writeReport(report,folder,keep=20):
+	folder = Path(folder)
+	folder.mkdir(parents=True,exist_ok=True)
+	outfile = folder / f'run-{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}.json'
+	outfile.write_text(json.dumps(report,indent=1))
+	for old in sorted(folder.glob('run-*.json'))[:-keep]:
+		old.unlink(missing_ok=True)
+	return outfile
+
+def _label(value):
+	return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+# node_exporter textfile collector format, written to a temp file and renamed so it is never read half written
+def writePrometheus(report,textfile):
+	lines = [
+		'# HELP revanced_stage_seconds Seconds spent in each stage during the last run.',
+		'# TYPE revanced_stage_seconds gauge'
+	]
+	lines += [f'revanced_stage_seconds{{stage="{_label(x)}"}} {y["total"]:.6f}' for x,y in report['stages'].items()]
+	lines += ['# HELP revanced_stage_max_seconds Longest single call of each stage during the last run.','# TYPE revanced_stage_max_seconds gauge']
+	lines += [f'revanced_stage_max_seconds{{stage="{_label(x)}"}} {y["max"]:.6f}' for x,y in report['stages'].items()]
+	lines += ['# HELP revanced_stage_calls Calls of each stage during the last run.','# TYPE revanced_stage_calls gauge']
+	lines += [f'revanced_stage_calls{{stage="{_label(x)}"}} {y["count"]}' for x,y in report['stages'].items()]
+	lines += ['# HELP revanced_stage_failures Calls of each stage that raised during the last run.','# TYPE revanced_stage_failures gauge']
+	lines += [f'revanced_stage_failures{{stage="{_label(x)}"}} {y["failed"]}' for x,y in report['stages'].items()]
+	lines += ['# HELP revanced_counter Counters of the last run.','# TYPE revanced_counter gauge']
+	lines += [f'revanced_counter{{name="{_label(x)}"}} {y}' for x,y in report['counters'].items()]
+	lines += ['# HELP revanced_phase_seconds Seconds revanced-cli spent in each phase during the last run.','# TYPE revanced_phase_seconds gauge']
+	lines += [f'revanced_phase_seconds{{phase="{_label(x)}"}} {y:.6f}' for x,y in report.get('phases',{}).items()]
+	statuses = {}
+	for job in report['jobs']:
+		statuses[job['status']] = statuses.get(job['status'],0) + 1
+	lines += ['# HELP revanced_jobs Apks of the last run by result.','# TYPE revanced_jobs gauge']
+	lines += [f'revanced_jobs{{status="{_label(x)}"}} {y}' for x,y in statuses.items()]
+	lines += [
+		'# HELP revanced_last_run_duration_seconds Wall time of the last run.',
+		'# TYPE revanced_last_run_duration_seconds gauge',
+		f'revanced_last_run_duration_seconds {report["duration"]:.3f}',
+		'# HELP revanced_last_run_timestamp_seconds When the last run finished.',
+		'# TYPE revanced_last_run_timestamp_seconds gauge',
+		f'revanced_last_run_timestamp_seconds {time.time():.0f}'
+	]
+	textfile = Path(textfile)
+	textfile.parent.mkdir(parents=True,exist_ok=True)
+	tmp = textfile.with_name(textfile.name + '.tmp')
+	tmp.write_text('\n'.join(lines) + '\n')
+	os.replace(tmp,textfile)
@@ -1,20 +1,35 @@
 from pathlib import Path
 import requests
+import requests.adapters
 import json, yaml
 import os
 import re
-import subprocess
 from hashlib import md5
-from tqdm import tqdm
 import shutil
 from datetime import datetime
 import unicodedata
-from validation import App
 import atexit
-from typing import Any
-from settings import _settings, handle_exceptions
+from typing import Any, NamedTuple, Optional
+from settings import _settings, handle_exceptions, versionKey
 from validation import Apk
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import threading
+from validation import JobResult
+from apkcache import ApkCache, partialHash, fileStat
+from axml import readApkInfo
+from buildmanifest import BuildManifest
+from catalog import loadCatalog, PatchCatalog
+from runner import runCommand, TailSink, FileSink
+from cliprofile import PatchProfiler
+from metrics import Metrics, writeReport, writePrometheus
+from toolstore import ToolStore
+from keystores import KeystoreRegistry
+import bundle
+import tarfile
+import argparse
+import sys
+from contextlib import nullcontext
 
 class bcolors:
 	HEADER = '\033[95m'
@@ -28,74 +43,297 @@ class bcolors:
 	UNDERLINE = '\033[4m'
 
 
+# shown instead of a command while the first download of the tools is still running
+TOOLS_MISSING = "ERROR: tools not downloaded yet"
+
+# the tools a patch run needs, swapped on Revanced as one value so a job never mixes two versions
+class Toolset(NamedTuple):
+	cli:Optional[Path]
+	patchesjar:Optional[Path]
+	patchesjson:Optional[Path]
+	integrations:Optional[Path]
+	catalog:Any
+
+	@property
+	def complete(self):
+		return None not in self[:4]
+
 class Revanced:
-	def __init__(self, settings='settings.yaml'):
+	# refresh=False starts from the tools already on disk, startRefresh() then looks for new ones in the background
+	def __init__(self, settings='settings.yaml', offline=False, refresh=True):
 		self.settingsFile = Path(settings)
+		self.offline = offline
+		self.listeners = []
+		self.refreshThread = None
+		self.metrics = Metrics()
+		self.lastReport = None
 		self.loadSettings()
 		atexit.register(self.saveSettings)
+		self.apkcache = ApkCache(self.settings.revancedCacheFolder / 'apkinfo.json')
+		atexit.register(self.apkcache.save)
+		self.manifest = BuildManifest(self.settings.revancedCacheFolder / 'build-manifest.json')
+		atexit.register(self.manifest.save)
 		self.storepass = None
-		self.loadPatches()
-  
+		self.cdslock = threading.Lock()
+		self.cdstried = set()
+		# archives a background build was started for, so concurrent jobs start only one each
+		self.cdsbuilding = set()
+		self.cdsbuildingLock = threading.Lock()
+		self.removeStaleCDS()
+		self.keystores = KeystoreRegistry(self.settings.outputFolder)
+		# apk path -> (inputs, argument list) and file -> (stat, content), see getPatchArgs and readFile
+		self.plans = {}
+		self.files = {}
+		self.toolstore = ToolStore(self.settings.revancedCacheFolder / 'toolstore.json',{
+			'cli':self.settings.revancedcliFolder,
+			'patchesjar':self.settings.revancedpatchesFolder,
+			'patchesjson':self.settings.revancedpatchesFolder,
+			'integrations':self.settings.revancedintegrationsFolder
+		},self.settings.toolPins)
+		self.toolset = self.loadToolset()
+		if refresh:
+			self.refreshTools()
+
+	@property
+	def revancedcli(self):
+		return self.toolset.cli
+
+	@property
+	def revancedpatch(self):
+		return self.toolset.patchesjar
+
+	@property
+	def revancedpatches(self):
+		return self.toolset.patchesjson
+
+	@property
+	def revancedinteg(self):
+		return self.toolset.integrations
+
+	@property
+	def apps(self):
+		return self.toolset.catalog
+
+	def addListener(self,callback):
+		self.listeners.append(callback)
+
+	# callbacks get (event, data), they run on whichever thread emits so gui listeners must hand off to their own thread
+	def emit(self,event,**data):
+		for callback in list(self.listeners):
+			try:
+				callback(event,data)
+			except Exception:
+				continue
+
 	def loadSettings(self):
 		self.settings = _settings(self.settingsFile)
-		self.getTools()
-		self.getLocalTools()
-  
+
+	# the highest installed version of each tool, or the one pinned in toolPins
 	def getLocalTools(self):
-		files = list(self.settings.revancedcliFolder.rglob('revanced-cli*.jar'))
-		self.revancedcli = max(files, key=os.path.getctime) if len(files)>0 else None
-		files = list(self.settings.revancedintegrationsFolder.rglob('revanced-integrations*.apk'))
-		self.revancedinteg = max(files, key=os.path.getctime) if len(files)>0 else None
-		files = list(self.settings.revancedpatchesFolder.rglob('revanced-patches*.jar'))
-		self.revancedpatch = max(files, key=os.path.getctime) if len(files)>0 else None
-		files = list(self.settings.revancedpatchesFolder.rglob('revanced-patches*.json'))
-		self.revancedpatches = max(files, key=os.path.getctime) if len(files)>0 else None
-  
+		self.toolstore.refresh()
+		return tuple(self.toolstore.get(x) for x in ('cli','patchesjar','patchesjson','integrations'))
+
+	def loadToolset(self):
+		cli, patchesjar, patchesjson, integrations = self.getLocalTools()
+		with self.metrics.span('loadPatches'):
+			catalog = loadCatalog(patchesjson,self.settings.revancedCacheFolder) if patchesjson else PatchCatalog([])
+		return Toolset(cli,patchesjar,patchesjson,integrations,catalog)
+
+	# checks for new tools and swaps them in as one unit once everything is downloaded,
+	# the current toolset stays usable the whole time
+	def refreshTools(self):
+		self.emit('refresh',state='checking')
+		res = self.getTools()
+		if not res[-1]:
+			self.emit('refresh',state='failed',error=str(res[0]))
+			return False
+		toolset = self.loadToolset()
+		old = self.toolset
+		changed = toolset[:4] != old[:4]
+		if changed:
+			self.toolset = toolset
+			self.emit('toolset',toolset=toolset)
+			# a batch may still be running with the previous tools
+			self.pruneTools([*old[:4],*toolset[:4]])
+		self.emit('refresh',state='done',changed=changed)
+		return True
+
+	# removes tool versions beyond toolsKeep, with the class data sharing archives of removed cli jars
+	def pruneTools(self,protect=()):
+		if not self.settings.toolsKeep:
+			return []
+		removed = self.toolstore.gc(self.settings.toolsKeep,protect)
+		for path in removed:
+			for archive in (self.settings.revancedCacheFolder / 'cds').glob(f'{path.stem}-*.jsa'):
+				archive.unlink(missing_ok=True)
+		return removed
+
+	def startRefresh(self):
+		if self.refreshThread is None or not self.refreshThread.is_alive():
+			self.refreshThread = threading.Thread(target=self.refreshTools,daemon=True)
+			self.refreshThread.start()
+
+	def waitForTools(self,timeout=None):
+		if self.refreshThread is not None:
+			self.refreshThread.join(timeout)
+		return self.toolset.complete
+
 	def saveSettings(self):
 		tmp = self.settings.to_dict()
 		yaml.dump(tmp,self.settingsFile.open('w',encoding='utf-8'))
 
-	def dowloadMostRecentTools(self,tools):
-		toollocation = None
-		for tool in tqdm(tools, 'Getting Tools'):
+	def dowloadMostRecentTools(self,tools,session=None):
+		downloads = []
+		for tool in tools:
+			toollocation = None
 			repo = tool['repository']
 			ct = tool['content_type']
 			if repo == 'revanced/revanced-patches' and ct == 'application/java-archive':
-				toollocation = self.settings.revancedpatchesFolder / tool['name']
+				kind, toollocation = 'patchesjar', self.settings.revancedpatchesFolder / tool['name']
 			elif repo == 'revanced/revanced-patches' and ct == 'application/json':
-				toollocation = self.settings.revancedpatchesFolder / ('revanced-patches-' + tool['version'] + '.json')
+				kind, toollocation = 'patchesjson', self.settings.revancedpatchesFolder / ('revanced-patches-' + tool['version'] + '.json')
 			elif repo == 'revanced/revanced-integrations':
-				toollocation = self.settings.revancedintegrationsFolder / tool['name']
+				kind, toollocation = 'integrations', self.settings.revancedintegrationsFolder / tool['name']
 			elif repo == 'revanced/revanced-cli':
-				toollocation = self.settings.revancedcliFolder / tool['name']
+				kind, toollocation = 'cli', self.settings.revancedcliFolder / tool['name']
 			if toollocation and not toollocation.exists():
-				dlTool(tool['browser_download_url'], toollocation)
-    
+				downloads.append((tool,toollocation,kind))
+		if len(downloads) == 0:
+			return []
+		# all assets share one pooled session so they reuse connections to the same hosts
+		with (nullcontext(session) if session else getSession(len(downloads))) as session, ThreadPoolExecutor(max_workers=min(4,len(downloads))) as pool:
+			futures = [pool.submit(self.download,tool['browser_download_url'],toollocation,tool.get('size'),session) for tool,toollocation,kind in downloads]
+			results = []
+			for (tool,toollocation,kind),future in zip(downloads,futures):
+				results.append(future.result())
+				if results[-1]:
+					self.toolstore.add(kind,toollocation,tool['version'])
+				self.emit('download',name=toollocation.name,ok=results[-1],done=len(results),total=len(downloads))
+			return results
+
+	def download(self,url,location,size=None,session=None):
+		with self.metrics.span('dlTool'):
+			ok = dlTool(url,location,size,session)
+		if ok:
+			self.metrics.add('downloadedBytes',location.stat().st_size)
+		return ok
+
+	# the tools in use and tools.json as one archive for hosts without internet, see bundle.py
+	def exportBundle(self,outfile):
+		self.toolstore.refresh()
+		tools = dict(zip(('cli','patchesjar','patchesjson','integrations'),self.toolset[:4]))
+		sums = {x:self.toolstore.entry(x,y)['sha256'] for x,y in tools.items() if y is not None and self.toolstore.entry(x,y)}
+		return bundle.exportBundle(outfile,tools,self.settings.toolsjsonFile,sums)
+
+	# unpacks a bundle into the tool folders, files already there with the same checksum are skipped
+	def importBundle(self,source):
+		self.toolstore.refresh()
+		def known(kind,path):
+			entry = self.toolstore.entry(kind,path)
+			return entry['sha256'] if entry and (entry['size'],entry['mtime']) == fileStat(path) else None
+		installed, skipped, toolsjson, manifest = bundle.importBundle(source,self.toolstore.folders,known)
+		if toolsjson is not None and json.loads(toolsjson) != self.loadToolsjson():
+			self.writeTools(json.loads(toolsjson))
+		toolset = self.loadToolset()
+		if toolset[:4] != self.toolset[:4]:
+			self.toolset = toolset
+			self.emit('toolset',toolset=toolset)
+		return installed, skipped
+
+	def lastUpdate(self):
+		lastup = self.settings.lastupDate
+		return lastup.date() if isinstance(lastup,datetime) else lastup
+
+	# once a day, unless offline, asks for new tool metadata with the validators of the last answer
+	# so unchanged metadata comes back as an empty 304 and the local tools.json is reused
 	@handle_exceptions
 	def getTools(self):
-		if self.settings.lastupDate != datetime.now().date():
+		if self.offline or self.settings.offline or self.lastUpdate() == datetime.now().date():
+			return ()
+		validators = self.loadValidators()
+		with self.metrics.span('getTools'), getSession() as session:
+			tools = self.fetchToolsjson(session,validators)
+			if tools is None:
+				tools = self.buildToolsjson(session,validators)
+			self.saveValidators(validators)
+			if not tools:
+				return ()
+			if tools != self.loadToolsjson():
+				self.writeTools(tools)
+			self.dowloadMostRecentTools(tools,session)
+		self.settings.lastupDate = datetime.now().date()
+		return ()
+
+	def loadToolsjson(self):
+		try:
+			return json.loads(self.settings.toolsjsonFile.read_text())
+		except (OSError,ValueError):
+			return None
+
+	# ETag/Last-Modified and the last good answer for every metadata url
+	def loadValidators(self):
+		try:
+			return json.loads((self.settings.revancedCacheFolder / 'http.json').read_text())
+		except (OSError,ValueError):
+			return {}
+
+	def saveValidators(self,validators):
+		(self.settings.revancedCacheFolder / 'http.json').write_text(json.dumps(validators))
+
+	def fetchToolsjson(self,session,validators):
+		url = self.settings.toolsjsonendpoint
+		response = conditionalGet(session,url,validators.get(url),self.settings.httpTimeout)
+		if response is None:
+			return None
+		if response.status_code == 304:
+			return self.loadToolsjson() or None
+		if response.status_code == 200:
 			try:
-				res = requests.get(self.settings.toolsjsonendpoint)
-				if res.status_code == 200:
-					tools = res.json()['tools']
-			except:
-				tools = self.buildToolsjson()
-			self.writeTools(tools)
-			json.dump(tools, self.settings.toolsjsonFile.open('w'))
-			self.dowloadMostRecentTools(tools)
-			self.settings.lastupDate = datetime.now().date()
+				tools = response.json()['tools']
+			except (ValueError,KeyError):
+				return None
+			validators[url] = getValidator(response)
+			return tools
+		return None
 
 	def writeTools(self,tools):
 		if self.settings.toolsjsonFile.exists():
 			backup = self.settings.toolsjsonFile.with_suffix('.json.bk.'+datetime.now().strftime("%Y-%m-%d"))
 			shutil.move(self.settings.toolsjsonFile, backup)
 		json.dump(tools, self.settings.toolsjsonFile.open('w'))
+		# one backup a day piles up, only the newest toolsKeep are left
+		if self.settings.toolsKeep:
+			backups = sorted(self.settings.toolsjsonFile.parent.glob(self.settings.toolsjsonFile.name + '.bk.*'))
+			for old in backups[:-self.settings.toolsKeep]:
+				old.unlink(missing_ok=True)
 
 	def getApkInfo(self,apkpath):
-		command = f'aapt dump badging "{apkpath.absolute().as_posix()}"'
-		res, errors ,succ = self.launchCommand(command)
-		if succ:
-			res = res.decode()
+		with self.metrics.span('getApkInfo'):
+			cached = self.apkcache.get(apkpath)
+			if cached is not None:
+				self.metrics.add('apkinfoCacheHits')
+				return Apk(path=apkpath,**cached)
+			self.metrics.add('apkinfoProbes')
+			apk = self.probeApk(apkpath)
+			if apk is not None:
+				self.apkcache.put(apkpath,apk)
+			return apk
+
+	# reads the manifest in-process, aapt is only used when that fails or is asked for in settings
+	def probeApk(self,apkpath):
+		if self.settings.apkinfoBackend != 'aapt':
+			try:
+				return readApkInfo(apkpath)
+			except Exception:
+				pass
+		return self.aaptApkInfo(apkpath)
+
+	def aaptApkInfo(self,apkpath):
+		out, errors = TailSink(None), TailSink()
+		run = runCommand(['aapt','dump','badging',apkpath.absolute().as_posix()],out,errors,timeout=120)
+		errors = errors.text() or (None if run.ok else run.describe())
+		if run.ok:
+			res = out.text()
 			pat = r"package: name='(.*)' versionCode='[0-9]*' versionName='(.*)' "# platformBuildVersionName='[\w]*'"
 			title = re.search(r"application-label:'(.*?)'",res).group(1).replace(' ', '_')
 			name, ver = re.search(pat, res).groups()
@@ -110,129 +348,566 @@ class Revanced:
 		return None
 
 	def loadPatches(self):
-		self.apps = {}
-		patches = json.load(self.revancedpatches.open('r'))
-		tmp = {'defaults':{'name':"General Apps",'description':"Can be applied to any app",'patches':[patch for patch in patches if patch['compatiblePackages'] is None]}}
-		for patch in patches:
-			apps = patch.pop('compatiblePackages')
-			if apps is None:
-				continue
-			for app in apps:
-				apatch = patch.copy()
-				apatch['versions'] = app.pop('versions')
-				if app['name'] not in tmp:
-					tmp[app['name']] = app
-					tmp[app['name']]['patches'] = tmp['defaults']['patches']+[apatch]
-				else:
-					tmp[app['name']]['patches'].append(apatch)
-
-		self.apps = {x:App(**y) for x,y in tmp.items()}
+		with self.metrics.span('loadPatches'):
+			self.toolset = self.toolset._replace(catalog=loadCatalog(self.revancedpatches,self.settings.revancedCacheFolder))
 
 	def loadAPK(self,apkpath,normalize=False):
 		apk = self.getApkInfo(apkpath)
-		if normalize: apk.normalizeName()
+		if apk is None: return None
+		if normalize:
+			oldpath = apk.path
+			if apk.normalizeName():
+				self.apkcache.move(oldpath,apk.path)
 		apk.outputFolder = self.settings.outputFolder
 		return apk
 
-	def run(self,apks:list=None,normalize=False,runcommand=True):
+	# jobs=1 keeps the old one-after-another behavior, anything higher runs that many revanced-cli processes at once
+	# apks whose output is already built from the same inputs are left alone unless force is set
+	# only the best version of each package is patched unless allVersions (or the patchAllVersions setting) is set
+	def run(self,apks:list=None,normalize=False,runcommand=True,jobs=None,force=False,allVersions=None):
 		if apks is None:
 			apks = list(self.settings.apkFolder.rglob('*.apk'))
-		for apkpath in tqdm(apks, 'Patching APKs'):
+		jobs = max(1,int(jobs or self.settings.patchJobs))
+		if allVersions is None:
+			allVersions = self.settings.patchAllVersions
+		# the whole batch uses the tools present when it started, even if a refresh swaps in new ones meanwhile
+		tools = self.toolset
+		results = [None]*len(apks)
+		# copies of the same apk would all write the same output, only one of them is patched
+		duplicates = self.findDuplicates(apks)
+		superseded = {} if allVersions else self.findSuperseded([x for x in apks if Path(x) not in duplicates],tools)
+		todo = []
+		for i,apkpath in enumerate(apks):
+			if Path(apkpath) in duplicates:
+				results[i] = JobResult(apkpath=apkpath,status='duplicate',duplicateOf=duplicates[Path(apkpath)])
+			elif Path(apkpath) in superseded:
+				results[i] = JobResult(apkpath=apkpath,status='superseded',supersededBy=superseded[Path(apkpath)])
+			else:
+				todo.append((i,apkpath))
+		if duplicates:
+			self.metrics.add('duplicates',len(duplicates))
+		if superseded:
+			self.metrics.add('superseded',len(superseded))
+		# the plan is out before any jvm starts
+		self.emit('plan',todo=[x for _,x in todo],duplicates=duplicates,superseded=superseded)
+		if runcommand and self.settings.jvmCDS and todo:
+			self.buildCDSArchive(tools)
+		if jobs == 1:
+			for done,(i,apkpath) in enumerate(todo):
+				results[i] = self.patchJob(apkpath,normalize,runcommand,force,tools)
+				self.emit('job',result=results[i],done=done+1,total=len(todo))
+		else:
+			with ThreadPoolExecutor(max_workers=jobs) as pool:
+				futures = {pool.submit(self.patchJob,apkpath,normalize,runcommand,force,tools):i for i,apkpath in todo}
+				for done,future in enumerate(as_completed(futures)):
+					results[futures[future]] = future.result()
+					self.emit('job',result=future.result(),done=done+1,total=len(todo))
+		self.apkcache.save()
+		self.manifest.save()
+		self.saveMetrics(results)
+		return results
+
+	# duplicate path -> the copy that is kept, for apks with identical content
+	# only apks of the same size are read, first their head and tail, then whole for the ones that still match
+	def findDuplicates(self,apks):
+		bysize = {}
+		for apkpath in dict.fromkeys(Path(x) for x in apks):
+			try:
+				bysize.setdefault(apkpath.stat().st_size,[]).append(apkpath)
+			except OSError:
+				continue
+		duplicates = {}
+		with self.metrics.span('findDuplicates'):
+			for group in bysize.values():
+				if len(group) < 2: continue
+				bypartial = {}
+				for apkpath in group:
+					bypartial.setdefault(partialHash(apkpath),[]).append(apkpath)
+				for candidates in bypartial.values():
+					if len(candidates) < 2: continue
+					byhash = {}
+					for apkpath in candidates:
+						byhash.setdefault(self.apkcache.hash(apkpath),[]).append(apkpath)
+					for same in byhash.values():
+						# the copy nearest the top of the folder is kept
+						keep = min(same,key=lambda x: (len(x.parts),x.as_posix()))
+						for apkpath in same:
+							if apkpath != keep:
+								duplicates[apkpath] = keep
+		return duplicates
+
+	# older path -> the apk patched instead, for packages with more than one apk
+	# the newest version some patch names wins, or the newest version when none of them name the package's versions
+	def findSuperseded(self,apks,tools=None):
+		catalog = (tools or self.toolset).catalog
+		packages = {}
+		with self.metrics.span('findSuperseded'):
+			for apkpath in dict.fromkeys(Path(x) for x in apks):
+				apk = self.getApkInfo(apkpath)
+				if apk is not None:
+					packages.setdefault(apk.name,[]).append((apkpath,apk))
+			superseded = {}
+			for package, candidates in packages.items():
+				if len(candidates) < 2: continue
+				rank = lambda x: (catalog.supports(package,x[1].version),versionKey(x[1].version))
+				best = max(rank(x) for x in candidates)
+				# the copy nearest the top of the folder when the same version is there twice
+				keep = min((x[0] for x in candidates if rank(x) == best),key=lambda x: (len(x.parts),x.as_posix()))
+				for apkpath, _ in candidates:
+					if apkpath != keep:
+						superseded[apkpath] = keep
+		return superseded
+
+	# everything timed since the last report, the next run starts counting from zero
+	def saveMetrics(self,results=()):
+		report = self.metrics.report(results)
+		self.metrics.reset()
+		self.lastReport = report
+		if self.settings.metricsReports:
+			report['file'] = writeReport(report,self.settings.revancedCacheFolder / 'metrics',self.settings.metricsReports).as_posix()
+		if self.settings.prometheusTextfile:
+			writePrometheus(report,self.settings.prometheusTextfile)
+		return report
+
+	# a single apk from probe to patched output, any failure is kept in the result instead of stopping the batch
+	def patchJob(self,apkpath,normalize=False,runcommand=True,force=False,tools=None):
+		tools = tools or self.toolset
+		result = JobResult(apkpath=apkpath)
+		start = time.perf_counter()
+		try:
 			apk = self.loadAPK(apkpath,normalize)
-			command = self.getPatchCommand(apk)
-			if runcommand and not command.startswith('ERROR:'):
-				self.runCommand(command,apk)
+			if apk is None:
+				raise ValueError(f'Could not read apk info from {apkpath}')
+			result.apk = apk
+			if not tools.complete:
+				result.status = 'skipped'
+				result.error = TOOLS_MISSING
+				return result
+			with self.metrics.span('getPatchCommand'):
+				args = self.getPatchArgs(apk,tools)
+			if args is None:
+				result.status = 'skipped'
+				result.error = "ERROR: No Patches Selected and No defaults Found"
+				return result
+			result.command = quoteCommand(args)
+			fingerprint = self.buildFingerprint(apk,tools)
+			if not force and self.manifest.isCurrent(apk.outputFile,fingerprint):
+				result.status = 'uptodate'
+			elif runcommand:
+				errors = TailSink(5)
+				keystore = Path(self.getKeystore(apk))
+				created = not keystore.exists()
+				profiler = PatchProfiler(self.expectedPatches(apk,tools))
+				run = self.runCommand(args,apk,[errors],profiler)
+				result.returncode = run.returncode
+				result.peakRss = run.peakRss
+				result.profile = profiler.profile()
+				self.metrics.profile(result.profile)
+				if run.ok:
+					result.status = 'done'
+					if created and keystore.exists():
+						# revanced-cli made the keystore, it is part of the fingerprint from now on
+						self.keystores.add(keystore)
+						fingerprint = self.buildFingerprint(apk,tools)
+					self.manifest.record(apk.outputFile,fingerprint,apk.path)
+				else:
+					result.status = 'failed'
+					result.error = f'{run.describe()}: {errors.text().strip()}' if errors.lines else run.describe()
+			else:
+				result.status = 'planned'
+		except Exception as e:
+			result.status = 'failed'
+			result.error = str(e)
+		finally:
+			result.elapsed = time.perf_counter() - start
+		return result
 
-	def runCommand(self,command,apk):
-		res, errors ,succ = self.launchCommand(command)
-		if errors:
-			apk.errorLog.open('w').write(errors)
-		return res,errors,succ
+	# everything that ends up in the patched apk: input, selected patches, options, tool versions and keystore
+	# None while the tools are incomplete, nothing can be built then
+	def buildFingerprint(self,apk,tools=None):
+		tools = tools or self.toolset
+		if not tools.complete:
+			return None
+		patches = self.readFile(apk.patches)
+		options = self.readFile(apk.options)
+		keystore = self.readFile(Path(self.getKeystore(apk)))
+		return genMD5({
+			'apk':self.apkcache.hash(apk.path),
+			'patches':patches.decode('utf-8') if patches is not None else None,
+			'options':options.decode('utf-8') if options is not None else None,
+			'cli':tools.cli.name,
+			'patchbundle':tools.patchesjar.name,
+			'integrations':tools.integrations.name,
+			'keystore':md5(keystore).hexdigest() if keystore is not None else None
+		})
+
+	# file contents kept until the file's size or mtime changes, None when it does not exist
+	def readFile(self,path):
+		stat = fileStat(path)
+		if stat is None:
+			return None
+		cached = self.files.get(path)
+		if cached is None or cached[0] != stat:
+			cached = self.files[path] = (stat,Path(path).read_bytes())
+		return cached[1]
+
+	# the whole output goes to the apk's .log and stderr also to its .error, extra sinks get stderr lines too
+	# a profiler reads both streams
+	def runCommand(self,args,apk,stderr=(),profiler=None):
+		log = FileSink(apk.patchLog)
+		# an .error left from an earlier run would be mistaken for this one's
+		apk.errorLog.unlink(missing_ok=True)
+		errors = FileSink(apk.errorLog)
+		profile = {x:[profiler.sink(x)] if profiler is not None else [] for x in ('stdout','stderr')}
+		try:
+			with self.metrics.span('runCommand'):
+				run = runCommand(args,[log,*profile['stdout']],[log,errors,*stderr,*profile['stderr']],timeout=self.settings.patchTimeout or None,idleTimeout=self.settings.patchIdleTimeout or None)
+			if profiler is not None:
+				profiler.finish()
+			if run.userTime is not None:
+				self.metrics.add('cliCpuSeconds',run.userTime + run.systemTime)
+			return run
+		finally:
+			log.close()
 
+	# patches revanced-cli will report for this apk: the selected ones plus the compatible defaults it applies anyway
+	def expectedPatches(self,apk,tools=None):
+		app = self.getApkPatches(apk.name,tools)
+		names = {x for x,y in app.patches.items() if y.use and app.isCompatible(x,apk.version)}
+		selection = self.readFile(apk.patches)
+		if selection is not None:
+			names.update(json.loads(selection))
+		return len(names)
+
+	# an app without a keystore gets the path revanced-cli will create it at
 	def getKeystore(self,apk):
-		res = list(apk.outputFolder.rglob(f'Revanced-{apk.title}*.keystore'))[-1]
-		if res:
-			return res.absolute().as_posix()
-		else:
-			return ''
-
-	def getPatchCommand(self,apk):
-		patches = ''
-		app = self.getApkPatches(apk.name)
-		if apk.patches.exists():
-			for i in json.loads(apk.patches.read_text()):
-				patches += f' -i "{i}" '
+		res = self.keystores.find(apk.title) or self.keystores.default(apk.title)
+		return res.absolute().as_posix()
+
+	# argument list for revanced-cli, None when there is nothing to patch or the tools are not all downloaded yet
+	# the list is reused until the apk's selection or options file, the tools, keystore or java flags change
+	def getPatchArgs(self,apk,tools=None):
+		tools = tools or self.toolset
+		if not tools.complete:
+			return None
+		keystore = self.getKeystore(apk)
+		jvmargs = self.getJvmArgs(tools)
+		key = (apk.name,apk.version,apk.title,apk.outputFile,tools[:4],id(tools.catalog),fileStat(apk.patches),fileStat(apk.options),keystore,self.settings.javaFile,jvmargs)
+		plan = self.plans.get(apk.path)
+		if plan is None or plan[0] != key:
+			plan = self.plans[apk.path] = (key,self.planPatchArgs(apk,tools,keystore,jvmargs))
+		return list(plan[1]) if plan[1] is not None else None
+
+	def planPatchArgs(self,apk,tools,keystore,jvmargs):
+		patches = []
+		app = self.getApkPatches(apk.name,tools)
+		selection = self.readFile(apk.patches)
+		if selection is not None:
+			for i in json.loads(selection):
+				patches += ['-i',i]
 		elif any(x for x in app.patches.values() if x.use):
 			pass
 		else:
+			return None
+		return [
+			self.settings.javaFile.absolute().as_posix(),
+			*jvmargs,
+			'-jar',
+			tools.cli.absolute().as_posix(),'patch',
+			'--out',apk.outputFile.absolute().as_posix(),
+			'--patch-bundle',tools.patchesjar.absolute().as_posix(),
+			'--merge',tools.integrations.absolute().as_posix(),
+			*patches,
+			*(['--options',apk.options.absolute().as_posix()] if apk.options.exists() else []),
+			'--keystore',keystore,
+			# '--keystore',self.keystore.absolute().as_posix(),'--common-name','Revanced',
+			apk.path.absolute().as_posix()
+		]
+
+	# the same command as one string, for showing and for QProcess
+	def getPatchCommand(self,apk,tools=None):
+		if not (tools or self.toolset).complete:
+			return TOOLS_MISSING
+		with self.metrics.span('getPatchCommand'):
+			args = self.getPatchArgs(apk,tools)
+		if args is None:
 			return "ERROR: No Patches Selected and No defaults Found"
-		command = (
-			f'"{self.settings.javaFile.absolute().as_posix()}" -jar ',
-			f'"{self.revancedcli.absolute().as_posix()}" patch ', 
-			f'--out "{apk.outputFile.absolute().as_posix()}" ',
-			f'--patch-bundle "{self.revancedpatch.absolute().as_posix()}" ',
-			f'--merge "{self.revancedinteg.absolute().as_posix()}" ' ,
-			patches,
-			f'--options "{apk.options.absolute().as_posix()}" ' if apk.options.exists() else '',
-			f'--keystore "{self.getKeystore(apk)}" ',
-			# f'--keystore "{self.keystore.absolute().as_posix()}" --common-name Revanced '
-			f'"{apk.path.absolute().as_posix()}"'
-		)
-		return ''.join(command)
-
-	def getApkPatches(self,appname):
-		if appname in self.apps:
-			return self.apps[appname]
-		return self.apps['defaults']
+		return quoteCommand(args)
 
-	@handle_exceptions
-	def launchCommand(self,command):
-		f = NamedTemporaryFile(mode='w', delete=False)
-		res = subprocess.check_output(command, stderr=f)
-		f.close()
-		with open(f.name, "r") as new_f:
-			errors = new_f.read()
-			return res, errors
+	# flags from the selected jvmProfiles entry plus the class data sharing archive of the current cli jar
+	def getJvmArgs(self,tools=None):
+		tools = tools or self.toolset
+		args = [str(x) for x in self.settings.jvmProfiles.get(self.settings.jvmProfile,[])]
+		if self.settings.jvmCDS and tools.cli is not None:
+			archive = self.cdsArchive(tools)
+			if archive.exists() and archive.stat().st_size > 0:
+				args.append(f'-XX:SharedArchiveFile={archive.absolute().as_posix()}')
+		return args
+
+	# for a run that is about to start, so its command never waits on the archive, run() builds it up front instead
+	# planning, dry runs and command previews only use an archive that already exists and never start a jvm
+	def startCDSBuild(self,tools=None):
+		tools = tools or self.toolset
+		if not self.settings.jvmCDS or not tools.complete:
+			return
+		archive = self.cdsArchive(tools)
+		if archive in self.cdstried or archive.exists():
+			return
+		with self.cdsbuildingLock:
+			start = archive not in self.cdsbuilding
+			self.cdsbuilding.add(archive)
+		if start:
+			threading.Thread(target=self.buildCDSInBackground,args=(tools,archive),daemon=True).start()
+
+	def buildCDSInBackground(self,tools,archive):
+		try:
+			self.buildCDSArchive(tools)
+		finally:
+			with self.cdsbuildingLock:
+				self.cdsbuilding.discard(archive)
+
+	# one archive per cli jar and java binary, an archive made by another jvm is rejected anyway
+	def cdsArchive(self,tools=None):
+		tools = tools or self.toolset
+		java = md5(self.settings.javaFile.absolute().as_posix().encode('utf-8')).hexdigest()[:8]
+		return self.settings.revancedCacheFolder / 'cds' / f'{tools.cli.stem}-{java}.jsa'
+
+	# records the classes revanced-cli loads while reading the patch bundle into a dynamic CDS archive (jdk 13+)
+	def buildCDSArchive(self,tools=None):
+		tools = tools or self.toolset
+		if tools.cli is None or tools.patchesjar is None:
+			return False
+		with self.cdslock:
+			archive = self.cdsArchive(tools)
+			if archive.exists() and archive.stat().st_size > 0:
+				return True
+			# a jvm that cannot dump an archive is only asked once per session
+			if archive in self.cdstried:
+				return False
+			self.cdstried.add(archive)
+			archive.parent.mkdir(parents=True,exist_ok=True)
+			tmp = archive.with_suffix('.jsa.tmp')
+			command = [
+				self.settings.javaFile.absolute().as_posix(),
+				*[str(x) for x in self.settings.jvmProfiles.get(self.settings.jvmProfile,[])],
+				f'-XX:ArchiveClassesAtExit={tmp.absolute().as_posix()}',
+				'-jar',tools.cli.absolute().as_posix(),
+				'list-patches',tools.patchesjar.absolute().as_posix()
+			]
+			try:
+				runCommand(command,timeout=300)
+				if tmp.exists() and tmp.stat().st_size > 0:
+					os.replace(tmp,archive)
+					return True
+				return False
+			finally:
+				tmp.unlink(missing_ok=True)
+
+	# half written archives of a build that was cut off when the last session exited
+	def removeStaleCDS(self):
+		for tmp in (self.settings.revancedCacheFolder / 'cds').glob('*.jsa.tmp'):
+			tmp.unlink(missing_ok=True)
+
+	# apks older than the version their patches are made for, with that version
+	def outdatedApks(self,apks=None,tools=None):
+		catalog = (tools or self.toolset).catalog
+		if apks is None:
+			apks = list(self.settings.apkFolder.rglob('*.apk'))
+		outdated = []
+		for apkpath in apks:
+			apk = self.loadAPK(apkpath)
+			if apk is not None and catalog.compareTarget(apk.name,apk.version) == -1:
+				outdated.append((apk,catalog.target(apk.name)))
+		return outdated
+
+	def getApkPatches(self,appname,tools=None):
+		catalog = (tools or self.toolset).catalog
+		if appname in catalog:
+			return catalog[appname]
+		return catalog['defaults']
 
 	
-	def buildToolsjson(self):
-		tools = []
-		@handle_exceptions
+	# asks the github releases api for every repo at once, a repo that answers 304 reuses its assets from the last answer
+	def buildToolsjson(self,session=None,validators=None):
+		if validators is None: validators = {}
 		def getgit(url,repo):
-			response = requests.get(url.replace('{{repo}}',repo))
-			if response.status_code == 200:
-				js = response.json()
-				for asset in js['assets']:
-					yield{
-						"repository": repo,
-						"version": js['tag_name'],
-						"timestamp": asset['updated_at'],
-						"name": asset['name'],
-						"size": asset['size'],
-						"browser_download_url": asset['browser_download_url'],
-						"content_type": asset["content_type"]
-					}
-		for repo in self.settings.githubrepos:
-			tools+= [x for x in getgit(self.settings.githubendpoint,repo) if isinstance(x,dict)]
-
+			response = conditionalGet(session,url,validators.get(url),self.settings.httpTimeout)
+			if response is None:
+				return validators.get(url,{}).get('tools',[])
+			if response.status_code == 304:
+				return validators[url].get('tools',[])
+			if response.status_code != 200:
+				return []
+			js = response.json()
+			tools = [{
+				"repository": repo,
+				"version": js['tag_name'],
+				"timestamp": asset['updated_at'],
+				"name": asset['name'],
+				"size": asset['size'],
+				"browser_download_url": asset['browser_download_url'],
+				"content_type": asset["content_type"]
+			} for asset in js['assets']]
+			validators[url] = getValidator(response) | {'tools':tools}
+			return tools
+		tools = []
+		with (nullcontext(session) if session else getSession()) as session, ThreadPoolExecutor(max_workers=max(1,len(self.settings.githubrepos))) as pool:
+			futures = [pool.submit(getgit,self.settings.githubendpoint.replace('{{repo}}',repo),repo) for repo in self.settings.githubrepos]
+			for future in futures:
+				try:
+					tools += future.result()
+				except Exception:
+					continue
 		return tools
 
 
+def quoteCommand(args):
+	return ' '.join(f'"{x}"' for x in args)
+
 def genMD5(data):
 	return md5(json.dumps(data).encode('utf-8')).hexdigest()
 
-def dlTool(url, location):
-	try:
-		response = requests.get(url)
-		with location.open("wb") as f:
-			f.write(response.content)
-		return True
-	except:
-		return False
+def getValidator(response):
+	validator = {}
+	if response.headers.get('ETag'):
+		validator['etag'] = response.headers['ETag']
+	if response.headers.get('Last-Modified'):
+		validator['lastModified'] = response.headers['Last-Modified']
+	return validator
+
+# GET with If-None-Match/If-Modified-Since, retrying timeouts, connection errors and 429/5xx with exponential backoff
+def conditionalGet(session,url,validator=None,timeout=10,retries=3,backoff=0.5):
+	headers = {}
+	if validator:
+		if validator.get('etag'):
+			headers['If-None-Match'] = validator['etag']
+		if validator.get('lastModified'):
+			headers['If-Modified-Since'] = validator['lastModified']
+	for attempt in range(retries):
+		try:
+			response = session.get(url,headers=headers,timeout=timeout)
+			if response.status_code not in (429,500,502,503,504):
+				return response
+		except requests.RequestException:
+			pass
+		if attempt < retries - 1:
+			time.sleep(backoff * 2**attempt)
+	return None
+
+def getSession(connections=4):
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections=connections,pool_maxsize=connections)
+	session.mount('https://',adapter)
+	session.mount('http://',adapter)
+	return session
+
+# streams into location.part, resuming it with a Range request after a dropped connection
+# and only renaming it into place once the size matches what tools.json says
+def dlTool(url, location, size=None, session=None, retries=3, chunksize=256*1024, timeout=30, backoff=0.5):
+	part = location.with_name(location.name + '.part')
+	http = session or requests
+	for attempt in range(retries):
+		# the same exponential backoff as conditionalGet, a flaky mirror gets a moment before the next try
+		if attempt:
+			time.sleep(backoff * 2**(attempt - 1))
+		try:
+			done = part.stat().st_size if part.exists() else 0
+			if size is not None and done > size:
+				part.unlink()
+				done = 0
+			if size is None or done < size or not part.exists():
+				headers = {'Range':f'bytes={done}-'} if done else {}
+				with http.get(url,headers=headers,stream=True,timeout=timeout) as response:
+					if response.status_code == 416:
+						part.unlink()
+						continue
+					response.raise_for_status()
+					# a server that ignores Range sends the whole file again
+					with part.open('ab' if response.status_code == 206 else 'wb') as f:
+						for chunk in response.iter_content(chunksize):
+							f.write(chunk)
+			if size is not None and part.stat().st_size != size:
+				if part.stat().st_size > size:
+					part.unlink()
+				continue
+			os.replace(part,location)
+			return True
+		except (requests.RequestException,OSError):
+			continue
+	return False
 
 
 if __name__ == "__main__":
-	rev = Revanced()
+	parser = argparse.ArgumentParser(description='Patch every apk in the apks folder with revanced-cli')
+	parser.add_argument('-j','--jobs',type=int,default=None,help='number of revanced-cli jobs to run at once (default: patchJobs setting)')
+	parser.add_argument('--purge-cache',action='store_true',help='forget all cached apk metadata before running')
+	parser.add_argument('--offline',action='store_true',help='do not check for new tools, use what is already downloaded')
+	parser.add_argument('--force',action='store_true',help='patch every apk even when its output is already up to date')
+	parser.add_argument('--dry-run',action='store_true',help='only report which apks would be patched')
+	parser.add_argument('--all-versions',action='store_true',default=None,help='patch every apk of a package, not only the newest version the patches support')
+	parser.add_argument('--export-bundle',metavar='FILE',type=Path,help='pack the tools in use and tools.json into FILE for hosts without internet, then exit')
+	parser.add_argument('--import-bundle',metavar='FILE',help='unpack a bundle made by --export-bundle into the tool folders (- reads it from stdin), then exit')
+	parser.add_argument('--outdated',action='store_true',help='only list apks older than the version their patches are made for')
+	args = parser.parse_args()
+	# starts on the tools already downloaded, only waiting for the update check when some are missing
+	rev = Revanced(offline=args.offline,refresh=False)
+	def progress(event,data):
+		if event == 'refresh' and data['state'] == 'failed':
+			print(f"{bcolors.WARNING}tool check failed: {data['error']}{bcolors.ENDC}")
+		elif event == 'download':
+			print(f"[{data['done']}/{data['total']}] {'downloaded' if data['ok'] else 'download failed'} {data['name']}")
+		elif event == 'plan':
+			for apkpath, kept in data['duplicates'].items():
+				print(f'{bcolors.WARNING}duplicate{bcolors.ENDC} {apkpath} is the same apk as {kept}, patched once')
+			for apkpath, kept in data['superseded'].items():
+				print(f'{bcolors.WARNING}superseded{bcolors.ENDC} {apkpath} ({rev.getApkInfo(apkpath).version}), {kept} ({rev.getApkInfo(kept).version}) is patched instead')
+			print(f"plan: {len(data['todo'])} apks to check, {len(data['superseded'])} other versions and {len(data['duplicates'])} duplicates left out")
+		elif event == 'job' and not args.dry_run:
+			print(f"[{data['done']}/{data['total']}] {data['result'].status} {data['result'].apkpath} {data['result'].elapsed:.1f}s")
+	rev.addListener(progress)
+	try:
+		if args.export_bundle:
+			manifest, digest = rev.exportBundle(args.export_bundle)
+			for entry in manifest['files']:
+				print(f"{entry['sha256'][:12]} {entry['kind']}/{entry['name']}")
+			print(f'{args.export_bundle} sha256 {digest}')
+			sys.exit()
+		if args.import_bundle:
+			installed, skipped = rev.importBundle(args.import_bundle)
+			for path in installed:
+				print(f'{bcolors.OKGREEN}installed{bcolors.ENDC} {path}')
+			for path in skipped:
+				print(f'already present {path}')
+			sys.exit()
+	except (bundle.BundleError,tarfile.TarError,OSError) as e:
+		sys.exit(f'{bcolors.FAIL}{e}{bcolors.ENDC}')
+	rev.startRefresh()
+	if not rev.toolset.complete and not rev.waitForTools():
+		sys.exit(f'{bcolors.FAIL}revanced-cli, patches or integrations missing and could not be downloaded{bcolors.ENDC}')
+	if args.purge_cache:
+		rev.apkcache.purge()
+	if args.outdated:
+		for apk, target in rev.outdatedApks():
+			print(f'{bcolors.WARNING}{apk.version} -> {target}{bcolors.ENDC} {apk.path}')
+		rev.apkcache.save()
+		sys.exit()
 
-	rev.run()
-	
\ No newline at end of file
+	results = rev.run(jobs=args.jobs,runcommand=not args.dry_run,force=args.force,allVersions=args.all_versions)
+	for result in results:
+		if result.status == 'failed':
+			print(f'{bcolors.FAIL}{result.apkpath}: {result.error}{bcolors.ENDC}')
+		elif args.dry_run and result.status == 'planned':
+			print(f'{bcolors.WARNING}rebuild{bcolors.ENDC} {result.apkpath} -> {result.apk.outputFile}')
+		elif args.dry_run and result.status == 'uptodate':
+			print(f'{bcolors.OKGREEN}up to date{bcolors.ENDC} {result.apkpath}')
+	print(f'{sum(x.status in ("done","planned") for x in results)} {"to patch" if args.dry_run else "patched"}, {sum(x.status == "uptodate" for x in results)} up to date, {sum(x.status == "failed" for x in results)} failed, {sum(x.status == "skipped" for x in results)} skipped, {sum(x.status == "duplicate" for x in results)} duplicates, {sum(x.status == "superseded" for x in results)} superseded')
+	for stage, timing in sorted(rev.lastReport['stages'].items(),key=lambda x: -x[1]['total']):
+		print(f"{stage:>16}: {timing['total']:8.2f}s in {timing['count']} calls, longest {timing['max']:.2f}s")
+	for phase, seconds in sorted(rev.lastReport['phases'].items(),key=lambda x: -x[1]):
+		print(f"{'cli ' + phase:>16}: {seconds:8.2f}s")
+	if rev.lastReport['patches']:
+		print('slowest patches:')
+	for name, timing in list(rev.lastReport['patches'].items())[:5]:
+		print(f"{timing['total']:8.2f}s {name} in {timing['count']} apks, longest {timing['max']:.2f}s{', ' + str(timing['failed']) + ' failed' if timing['failed'] else ''}")
+	if 'file' in rev.lastReport:
+		print(f"timings saved to {rev.lastReport['file']}")
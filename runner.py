@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import codecs
+from collections import deque
+from typing import NamedTuple, Optional
+
+# runs a command from an argument list, both pipes are read line by line and handed to sinks as they arrive
+# so nothing but the sinks decides how much output is kept. a job that runs too long, or goes quiet for too long,
+# has its whole process group killed
+
+# longest piece handed to a sink at once, a huge line without newlines is passed on in parts
+LINE_LIMIT = 64 * 1024
+# time between asking the process tree to stop and killing it
+KILL_GRACE = 5
+
+class RunResult(NamedTuple):
+	argv: list
+	returncode: Optional[int]
+	started: float
+	elapsed: float
+	userTime: Optional[float] = None
+	systemTime: Optional[float] = None
+	# bytes, None where the os does not report it
+	peakRss: Optional[int] = None
+	# None, 'wall' or 'idle'
+	timedOut: Optional[str] = None
+	error: Optional[str] = None
+
+	@property
+	def ok(self):
+		return self.returncode == 0 and self.timedOut is None and self.error is None
+
+	def describe(self):
+		if self.error is not None:
+			return self.error
+		if self.timedOut == 'wall':
+			return f'killed after running {self.elapsed:.0f}s'
+		if self.timedOut == 'idle':
+			return f'killed after {self.elapsed:.0f}s, no output for too long'
+		return f'exit code {self.returncode}'
+
+# keeps the last lines of a stream, decoded, for error messages
+class TailSink:
+	def __init__(self,lines=50):
+		self.lines = deque(maxlen=lines)
+		self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+	def __call__(self,data):
+		self.lines.append(self.decoder.decode(data))
+
+	def text(self):
+		return ''.join(self.lines)
+
+# opens its file on the first line, so a quiet stream does not leave an empty file behind
+# one sink may be given to both streams, their reader threads take turns through the lock
+class FileSink:
+	def __init__(self,path,mode='wb'):
+		self.path = path
+		self.mode = mode
+		self.file = None
+		self.lock = threading.Lock()
+
+	def __call__(self,data):
+		with self.lock:
+			if self.file is None:
+				self.file = open(self.path,self.mode)
+			self.file.write(data)
+
+	def close(self):
+		with self.lock:
+			if self.file is not None:
+				self.file.close()
+				self.file = None
+
+def _sinks(sinks):
+	if sinks is None:
+		return []
+	if callable(sinks):
+		return [sinks]
+	return list(sinks)
+
+def _pump(pipe,sinks,activity):
+	try:
+		for line in iter(lambda: pipe.readline(LINE_LIMIT),b''):
+			activity[0] = time.monotonic()
+			for sink in sinks:
+				sink(line)
+	except (OSError,ValueError):
+		pass
+	finally:
+		pipe.close()
+
+# the process is started in its own group / session, so everything it started goes with it
+def killTree(process,grace=KILL_GRACE):
+	if os.name == 'nt':
+		subprocess.run(['taskkill','/F','/T','/PID',str(process.pid)],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+		return
+	try:
+		os.killpg(process.pid,signal.SIGTERM)
+	except OSError:
+		return
+	deadline = time.monotonic() + grace
+	while time.monotonic() < deadline:
+		try:
+			os.killpg(process.pid,0)
+		except OSError:
+			return
+		time.sleep(0.05)
+	try:
+		os.killpg(process.pid,signal.SIGKILL)
+	except OSError:
+		pass
+
+def runCommand(argv,stdout=None,stderr=None,timeout=None,idleTimeout=None,cwd=None):
+	argv = [str(x) for x in argv]
+	started = time.time()
+	start = time.monotonic()
+	kw = {'creationflags':subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == 'nt' else {'start_new_session':True}
+	try:
+		process = subprocess.Popen(argv,stdin=subprocess.DEVNULL,stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=cwd,**kw)
+	except OSError as e:
+		return RunResult(argv,None,started,time.monotonic() - start,error=f'could not start {argv[0]}: {e}')
+	activity = [start]
+	readers = [
+		threading.Thread(target=_pump,args=(process.stdout,_sinks(stdout),activity),daemon=True),
+		threading.Thread(target=_pump,args=(process.stderr,_sinks(stderr),activity),daemon=True)
+	]
+	for reader in readers:
+		reader.start()
+
+	# wait4 reaps the child itself so its resource usage is not lost, popen is told the exit code afterwards
+	usage = [None]
+	ended = [None]
+	exited = threading.Event()
+	def waiter():
+		if hasattr(os,'wait4'):
+			_, status, usage[0] = os.wait4(process.pid,0)
+			process.returncode = os.waitstatus_to_exitcode(status)
+		else:
+			process.wait()
+		ended[0] = time.monotonic()
+		exited.set()
+	threading.Thread(target=waiter,daemon=True).start()
+
+	timedOut = None
+	while not exited.wait(0.2):
+		now = time.monotonic()
+		if timeout and now - start > timeout:
+			timedOut = 'wall'
+		elif idleTimeout and now - activity[0] > idleTimeout:
+			timedOut = 'idle'
+		if timedOut:
+			killTree(process)
+			exited.wait()
+			break
+	elapsed = ended[0] - start
+	for reader in readers:
+		reader.join(KILL_GRACE)
+	if any(x.is_alive() for x in readers):
+		# a detached grandchild still holds the pipes, it goes with the rest of the group
+		killTree(process)
+		for reader in readers:
+			reader.join(KILL_GRACE)
+	for sink in _sinks(stdout) + _sinks(stderr):
+		if hasattr(sink,'close'):
+			sink.close()
+
+	result = RunResult(argv,process.returncode,started,elapsed,timedOut=timedOut)
+	if usage[0] is not None:
+		# ru_maxrss is in kilobytes on linux and bytes on macos
+		scale = 1 if sys.platform == 'darwin' else 1024
+		result = result._replace(userTime=usage[0].ru_utime,systemTime=usage[0].ru_stime,peakRss=usage[0].ru_maxrss * scale)
+	return result
@@ -25,6 +25,21 @@ def parse_date(value):
 				continue
 	return datetime.fromtimestamp(0)
 
+# sortable key for version names like 18.45.43, 4.7.0-dev.2 or v1.10, a prerelease sorts below its release
+# 4.0 and 4.0.0 get the same key, something that is not a version sorts below every version
+def versionKey(version):
+	if version is None:
+		return ((),)
+	m = re.match(r'\s*v?(\d+(?:\.\d+)*)(?:[-+ ._]?(.*))?$',str(version))
+	if m is None:
+		return ((),)
+	release = tuple(int(x) for x in m.group(1).split('.'))
+	while len(release) > 1 and release[-1] == 0:
+		release = release[:-1]
+	if not m.group(2):
+		return (release,1,())
+	return (release,0,tuple((0,int(x),'') if x.isdigit() else (1,0,x) for x in re.split(r'[.-]',m.group(2)) if x))
+
 class _settings:
 	defaults = {
 		'lastupDate':datetime.fromtimestamp(0).date(),
@@ -45,12 +60,42 @@ class _settings:
 		],
 		'apkeditorlink':'https://github.com/REAndroid/APKEditor/releases/latest',
 		'aaptFile':'adb\\aapt',
+		# python reads AndroidManifest.xml/resources.arsc directly, aapt runs aapt dump badging
+		'apkinfoBackend':'python',
 		'outputFolder':'output',
 		'javaFile':'zulu17\\bin\\java.exe',
 		'revancedCacheFolder':'revanced-cache',
 		"keystoreFile": "revanced\\revanced.keystore",
 		"keystorealias": "revanced",
-		"errorFile":"error.txt"
+		"errorFile":"error.txt",
+		# skip the daily tool check and only use tools that are already downloaded
+		"offline":False,
+		# seconds before a tool metadata request is given up on
+		"httpTimeout":10,
+		# extra java flags for revanced-cli, jvmProfile picks one of jvmProfiles
+		"jvmProfile":"default",
+		"jvmProfiles":{
+			'default':[],
+			'fast':['-Xmx4g','-XX:+UseParallelGC','-XX:TieredStopAtLevel=1'],
+			'lowmem':['-Xmx1g','-XX:+UseSerialGC'],
+		},
+		# cache the classes revanced-cli loads in a class data sharing archive so later jvms start faster
+		"jvmCDS":True,
+		# how many revanced-cli processes run() starts at once, 1 patches one apk after another
+		"patchJobs":1,
+		# seconds a revanced-cli job may run in total / without printing anything before it is killed, 0 for no limit
+		"patchTimeout":3600,
+		"patchIdleTimeout":900,
+		# json timing reports of the last runs kept in revanced-cache/metrics, 0 writes none
+		"metricsReports":20,
+		# node_exporter textfile collector file the last run's timings are written to, empty for none
+		"prometheusTextfile":"",
+		# patch every apk of a package, not only the newest version the patches support
+		"patchAllVersions":False,
+		# versions of each tool (and tools.json backups) kept on disk after a refresh, 0 keeps everything
+		"toolsKeep":2,
+		# tool -> version used instead of the newest, for cli, patches and integrations
+		"toolPins":{}
 	}	
 	settings = {}
 	def __init__(self,configFile:Path):
@@ -85,6 +130,9 @@ class _settings:
 				self.settings[x] = Path(y)
 			elif x.endswith('Date'):
 				self.settings[x] = parse_date(y)
+			elif isinstance(self.defaults.get(x),list) and isinstance(y,str):
+				# older saves wrote lists as their python repr
+				self.settings[x] = yaml.safe_load(y)
 			else:
 				self.settings[x] = y
 				
@@ -96,6 +144,8 @@ class _settings:
 		for k,v in data.items():
 			if k.endswith('Date'):
 				jsondata[k] = v.strftime('%Y-%m-%d')
+			elif isinstance(v,(bool,int,float,list,dict)) or v is None:
+				jsondata[k] = v
 			else:
 				jsondata[k] = str(v)
 		return jsondata
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import shutil
+import struct
+import zipfile
+import subprocess
+from pathlib import Path
+import pytest
+
+sys.path.insert(0,str(Path(__file__).resolve().parent.parent))
+import axml
+from axml import ResourceTable, StringPool, readApkInfo, TYPE_REFERENCE, TYPE_STRING
+
+# binary manifests and resource tables built by hand, laid out like aapt2 writes them
+# resources live in package 0x7f, type 1 (string), so entry n is 0x7f01000n
+
+TYPE_INT_DEC = 0x10
+
+def stringPool(strings,utf8=False):
+	data = b''
+	offsets = []
+	for s in strings:
+		offsets.append(len(data))
+		if utf8:
+			raw = s.encode('utf-8')
+			data += _length8(len(s)) + _length8(len(raw)) + raw + b'\0'
+		else:
+			data += _length16(len(s)) + s.encode('utf-16-le') + b'\0\0'
+	data += b'\0' * (-len(data) % 4)
+	hsize = 28
+	body = struct.pack(f'<{len(strings)}I',*offsets) + data
+	return struct.pack('<HHIIIIII',0x0001,hsize,hsize + len(body),len(strings),0,axml.UTF8_FLAG if utf8 else 0,hsize + 4*len(strings),0) + body
+
+def _length8(n):
+	return bytes([0x80 | n >> 8,n & 0xff]) if n > 0x7f else bytes([n])
+
+def _length16(n):
+	return struct.pack('<HH',0x8000 | n >> 16,n & 0xffff) if n > 0x7fff else struct.pack('<H',n)
+
+# ResTable_config: size, imsi, locale at 8, screen type with density at 14
+def config(locale=b'',density=0):
+	data = bytearray(64)
+	struct.pack_into('<I',data,0,64)
+	data[8:8+len(locale)] = locale
+	struct.pack_into('<H',data,14,density)
+	return bytes(data)
+
+DEFAULT = config()
+GERMAN = config(b'de')
+FRENCH = config(b'fr')
+HDPI = config(density=240)
+
+# entry -> (kind, type, data), kind is plain, compact or complex
+def entryBytes(key,kind,dtype,value):
+	if kind == 'compact':
+		return struct.pack('<HHI',key,axml.FLAG_COMPACT | dtype << 8,value)
+	if kind == 'complex':
+		# a bag with one item, the reader has no use for those
+		return struct.pack('<HHIII',16,axml.FLAG_COMPLEX,key,0,1) + struct.pack('<IHBBI',0x01000000,8,0,dtype,value)
+	return struct.pack('<HHI',8,0,key) + struct.pack('<HBBI',8,0,dtype,value)
+
+def typeChunk(tid,conf,entries,count,encoding='dense'):
+	data = b''
+	offsets = {}
+	for entry in sorted(entries):
+		offsets[entry] = len(data)
+		data += entryBytes(entry,*entries[entry])
+	flags = 0
+	if encoding == 'sparse':
+		flags = axml.FLAG_SPARSE
+		table = b''.join(struct.pack('<HH',x,y // 4) for x,y in offsets.items())
+		count = len(offsets)
+	elif encoding == 'offset16':
+		flags = axml.FLAG_OFFSET16
+		table = b''.join(struct.pack('<H',offsets[x] // 4 if x in offsets else 0xFFFF) for x in range(count))
+	else:
+		table = b''.join(struct.pack('<I',offsets.get(x,axml.NO_ENTRY)) for x in range(count))
+	table += b'\0' * (-len(table) % 4)
+	hsize = 20 + len(conf)
+	return struct.pack('<HHIBBHII',0x0201,hsize,hsize + len(table) + len(data),tid,flags,0,count,hsize + len(table)) + conf + table + data
+
+def typeSpec(tid,count):
+	body = struct.pack(f'<{count}I',*[0]*count)
+	return struct.pack('<HHIBBHI',0x0202,16,16 + len(body),tid,0,0,count) + body
+
+def packageChunk(pid,chunks,types=('string','plurals')):
+	typePool = stringPool(list(types))
+	keyPool = stringPool([f'key{i}' for i in range(8)])
+	body = typePool + keyPool + b''.join(chunks)
+	hsize = 288
+	name = 'com.example'.encode('utf-16-le').ljust(256,b'\0')
+	return struct.pack('<HHII',0x0200,hsize,hsize + len(body),pid) + name + struct.pack('<IIIII',hsize,0,hsize + len(typePool),0,0) + body
+
+def resourceTable(strings,packages,utf8=True):
+	body = stringPool(strings,utf8) + b''.join(packages)
+	return struct.pack('<HHII',0x0002,12,12 + len(body),len(packages)) + body
+
+def attribute(name,dtype,value,raw=axml.NO_ENTRY):
+	return struct.pack('<IIIHBBI',axml.NO_ENTRY,name,raw,8,0,dtype,value)
+
+def startElement(name,attrs):
+	ext = struct.pack('<IIHHHHHH',axml.NO_ENTRY,name,20,20,len(attrs),0,0,0)
+	body = ext + b''.join(attrs)
+	return struct.pack('<HHIII',0x0102,16,16 + len(body),1,axml.NO_ENTRY) + body
+
+# versionName and label are (type, data), a string is put in the pool and referenced from rawValue like aapt does
+def manifest(package,versionName,label,utf8=False):
+	strings = ['label','versionName','package','manifest','application']
+	def attr(name,value):
+		if isinstance(value,str):
+			strings.append(value)
+			return attribute(name,TYPE_STRING,len(strings) - 1,len(strings) - 1)
+		return attribute(name,*value)
+	attrs = [attr(1,versionName),attr(2,package)]
+	appattrs = [attr(0,label)]
+	resmap = struct.pack('<II',axml.ATTR_LABEL,axml.ATTR_VERSIONNAME)
+	body = (
+		stringPool(strings,utf8)
+		+ struct.pack('<HHI',0x0180,8,8 + len(resmap)) + resmap
+		+ startElement(3,attrs)
+		+ startElement(4,appattrs)
+	)
+	return struct.pack('<HHI',0x0003,8,8 + len(body)) + body
+
+LONG = 'Ünïcödé label ✓ ' * 12
+STRINGS = ['Meine App','App HD','My App','18.45.43','Mon App','App hdpi',LONG]
+
+# entry 0: the label in German, hdpi and default, each config in another entry encoding, the default last
+# entry 1: versionName, a reference to entry 2, a compact string entry
+# entry 3: only a French and an hdpi value
+# entry 4: a bag only, entry 5: refers to itself, entry 6: a long non-ascii string
+def appTable(utf8=True):
+	chunks = [
+		typeSpec(1,7),
+		typeChunk(1,GERMAN,{0:('plain',TYPE_STRING,0)},7,'dense'),
+		typeChunk(1,FRENCH,{3:('plain',TYPE_STRING,4)},7,'offset16'),
+		typeChunk(1,HDPI,{0:('plain',TYPE_STRING,1),3:('compact',TYPE_STRING,5)},7,'offset16'),
+		typeChunk(2,DEFAULT,{0:('plain',TYPE_STRING,3)},1,'dense'),
+		typeChunk(1,DEFAULT,{
+			0:('plain',TYPE_STRING,2),
+			1:('plain',TYPE_REFERENCE,0x7f010002),
+			2:('compact',TYPE_STRING,3),
+			4:('complex',TYPE_STRING,2),
+			5:('compact',TYPE_REFERENCE,0x7f010005),
+			6:('plain',TYPE_STRING,6)
+		},7,'sparse')
+	]
+	return resourceTable(STRINGS,[packageChunk(0x7f,chunks)],utf8)
+
+@pytest.fixture(params=[True,False],ids=['utf8','utf16'])
+def table(request):
+	return ResourceTable(appTable(request.param))
+
+def test_string_pool_lengths():
+	strings = ['',LONG,'x' * 300,'ascii']
+	for utf8 in (True,False):
+		pool = StringPool(stringPool(strings,utf8),0)
+		assert [pool[i] for i in range(len(pool))] == strings
+		assert pool[len(strings)] is None
+
+def test_default_config_wins(table):
+	values = {(x[8:10],y,z) for x,y,z in table.values(0x7f010000)}
+	assert values == {(b'de',TYPE_STRING,0),(b'\0\0',TYPE_STRING,1),(b'\0\0',TYPE_STRING,2)}
+	assert table.resolve(0x7f010000) == 'My App'
+
+def test_reference_to_compact_entry(table):
+	assert list(table.values(0x7f010001)) == [(DEFAULT,TYPE_REFERENCE,0x7f010002)]
+	assert table.resolve(0x7f010001) == '18.45.43'
+
+def test_density_before_locale(table):
+	assert table.resolve(0x7f010003) == 'App hdpi'
+
+def test_unresolvable(table):
+	# a bag, a reference loop, an entry past the end, another type's entry and an unknown package
+	assert list(table.values(0x7f010004)) == []
+	assert table.resolve(0x7f010004) is None
+	assert table.resolve(0x7f010005) is None
+	assert table.resolve(0x7f010063) is None
+	assert table.resolve(0x7f020000) == '18.45.43'
+	assert table.resolve(0x01010000) is None
+
+def test_long_string(table):
+	assert table.resolve(0x7f010006) == LONG
+
+@pytest.mark.parametrize('encoding',['dense','offset16','sparse'])
+@pytest.mark.parametrize('kind',['plain','compact'])
+def test_entry_encodings(encoding,kind):
+	entries = {1:(kind,TYPE_STRING,0),4:(kind,TYPE_STRING,1)}
+	table = ResourceTable(resourceTable(['one','four'],[packageChunk(0x7f,[typeChunk(1,DEFAULT,entries,6,encoding)])]))
+	assert [table.resolve(0x7f010000 + x) for x in range(6)] == [None,'one',None,None,'four',None]
+
+def writeApk(path,manifestData,tableData=None):
+	with zipfile.ZipFile(path,'w') as z:
+		z.writestr('AndroidManifest.xml',manifestData)
+		if tableData is not None:
+			z.writestr('resources.arsc',tableData)
+	return path
+
+@pytest.mark.parametrize('utf8',[True,False],ids=['utf8','utf16'])
+def test_apk_with_resource_references(tmp_path,utf8):
+	data = manifest('com.example.app',(TYPE_REFERENCE,0x7f010001),(TYPE_REFERENCE,0x7f010000),utf8)
+	apk = readApkInfo(writeApk(tmp_path / 'app.apk',data,appTable(not utf8)))
+	assert (apk.name,apk.version,apk.title) == ('com.example.app','18.45.43','My_App')
+
+def test_apk_with_inline_values(tmp_path):
+	# no resources.arsc needed, and none is read
+	apk = readApkInfo(writeApk(tmp_path / 'app.apk',manifest('com.example.app','2.1.0','Inline App')))
+	assert (apk.name,apk.version,apk.title) == ('com.example.app','2.1.0','Inline_App')
+	apk = readApkInfo(writeApk(tmp_path / 'int.apk',manifest('com.example.app',(TYPE_INT_DEC,42),'Inline App')))
+	assert apk.version == '42'
+
+def test_apk_with_missing_label_resource(tmp_path):
+	data = manifest('com.example.app','1.0',(TYPE_REFERENCE,0x7f010063))
+	apk = readApkInfo(writeApk(tmp_path / 'app.apk',data,appTable()))
+	assert apk.title == 'com.example.app'
+
+# a real apk against aapt's badging, e.g. AXML_TEST_APK=~/apks/youtube.apk with build-tools on PATH
+@pytest.mark.skipif(not os.environ.get('AXML_TEST_APK') or not (shutil.which('aapt') or shutil.which('aapt2')),reason='needs AXML_TEST_APK and aapt')
+def test_matches_aapt():
+	path = os.environ['AXML_TEST_APK']
+	aapt = shutil.which('aapt') or shutil.which('aapt2')
+	badging = subprocess.run([aapt,'dump','badging',path],capture_output=True,text=True,check=True).stdout
+	name = re.search(r"package: name='([^']*)'",badging).group(1)
+	version = re.search(r"versionName='([^']*)'",badging).group(1)
+	label = re.search(r"application-label:'([^']*)'",badging).group(1)
+	apk = readApkInfo(path)
+	assert (apk.name,apk.version,apk.title) == (name,version,label.replace(' ','_'))
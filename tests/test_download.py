@@ -0,0 +1,146 @@
+import sys
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+
+sys.path.insert(0,str(Path(__file__).resolve().parent.parent))
+from patchtool import dlTool, conditionalGet, getValidator
+
+BODY = bytes(range(256)) * 64
+ETAG = '"v1"'
+MODIFIED = 'Sat, 01 Jun 2024 12:00:00 GMT'
+
+# a local stand-in for the release host, each test queues how the next requests are answered
+# and reads back the headers they came with
+class Server(ThreadingHTTPServer):
+	daemon_threads = True
+	def __init__(self):
+		super().__init__(('127.0.0.1',0),Handler)
+		self.plan = []
+		self.seen = []
+
+	@property
+	def url(self):
+		return f'http://127.0.0.1:{self.server_address[1]}/tool.jar'
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	def log_message(self,*args):
+		pass
+
+	def do_GET(self):
+		self.server.seen.append(dict(self.headers))
+		action = self.server.plan.pop(0) if self.server.plan else 'serve'
+		getattr(self,action)()
+
+	def _send(self,status,data,headers=()):
+		self.send_response(status)
+		for name, value in headers:
+			self.send_header(name,value)
+		self.send_header('Content-Length',str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	# honours Range and the validators like a well behaved server
+	def serve(self):
+		if self.headers.get('If-None-Match') == ETAG or self.headers.get('If-Modified-Since') == MODIFIED:
+			self.send_response(304)
+			self.send_header('ETag',ETAG)
+			self.end_headers()
+			return
+		headers = [('ETag',ETAG),('Last-Modified',MODIFIED)]
+		start = self.headers.get('Range','bytes=0-')[6:-1]
+		if start and int(start):
+			self._send(206,BODY[int(start):],[*headers,('Content-Range',f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')])
+		else:
+			self._send(200,BODY,headers)
+
+	# promises the whole file, then drops the connection halfway
+	def drop(self):
+		self.send_response(200)
+		self.send_header('Content-Length',str(len(BODY)))
+		self.end_headers()
+		self.wfile.write(BODY[:len(BODY) // 2])
+		self.wfile.flush()
+		self.close_connection = True
+		self.connection.shutdown(2)
+
+	# a complete response with the wrong content
+	def corrupt(self):
+		self._send(200,BODY + b'junk')
+
+	# answers a Range request with the whole file
+	def ignoreRange(self):
+		self._send(200,BODY)
+
+	def busy(self):
+		self._send(503,b'')
+
+@pytest.fixture
+def server():
+	server = Server()
+	thread = threading.Thread(target=server.serve_forever,daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+def test_resumes_after_dropped_connection(server,tmp_path):
+	server.plan = ['drop']
+	target = tmp_path / 'tool.jar'
+	# small chunks, so the half that arrived is on disk before the connection drops
+	assert dlTool(server.url,target,len(BODY),chunksize=1024,backoff=0)
+	assert target.read_bytes() == BODY
+	assert not (tmp_path / 'tool.jar.part').exists()
+	assert 'Range' not in server.seen[0]
+	assert server.seen[1]['Range'] == f'bytes={len(BODY) // 2}-'
+
+def test_server_ignoring_range_restarts_file(server,tmp_path):
+	server.plan = ['drop','ignoreRange']
+	target = tmp_path / 'tool.jar'
+	assert dlTool(server.url,target,len(BODY),chunksize=1024,backoff=0)
+	assert target.read_bytes() == BODY
+	assert 'Range' in server.seen[1]
+
+def test_size_mismatch_deletes_and_retries(server,tmp_path):
+	server.plan = ['corrupt']
+	target = tmp_path / 'tool.jar'
+	assert dlTool(server.url,target,len(BODY),backoff=0)
+	assert target.read_bytes() == BODY
+	# the oversized part was thrown away, not resumed
+	assert len(server.seen) == 2 and 'Range' not in server.seen[1]
+
+def test_gives_up_after_retries(server,tmp_path):
+	server.plan = ['corrupt'] * 3
+	target = tmp_path / 'tool.jar'
+	assert not dlTool(server.url,target,len(BODY),backoff=0)
+	assert not target.exists()
+	assert not (tmp_path / 'tool.jar.part').exists()
+	assert len(server.seen) == 3
+
+def test_conditional_get_etag(server):
+	session = requests.Session()
+	response = conditionalGet(session,server.url,backoff=0)
+	assert response.status_code == 200 and response.content == BODY
+	validator = getValidator(response)
+	assert validator == {'etag':ETAG,'lastModified':MODIFIED}
+	response = conditionalGet(session,server.url,validator,backoff=0)
+	assert response.status_code == 304
+	assert server.seen[1]['If-None-Match'] == ETAG
+	assert server.seen[1]['If-Modified-Since'] == MODIFIED
+
+def test_conditional_get_modified_since(server):
+	response = conditionalGet(requests.Session(),server.url,{'lastModified':MODIFIED},backoff=0)
+	assert response.status_code == 304
+	assert 'If-None-Match' not in server.seen[0]
+	response = conditionalGet(requests.Session(),server.url,{'lastModified':'Mon, 01 Jan 2024 00:00:00 GMT'},backoff=0)
+	assert response.status_code == 200
+
+def test_conditional_get_retries_busy_server(server):
+	server.plan = ['busy','busy']
+	response = conditionalGet(requests.Session(),server.url,backoff=0)
+	assert response.status_code == 200 and len(server.seen) == 3
+	server.plan = ['busy'] * 3
+	assert conditionalGet(requests.Session(),server.url,backoff=0) is None
@@ -0,0 +1,193 @@
+from pathlib import Path
+import os
+import re
+import json
+import threading
+from datetime import datetime
+from apkcache import fileHash
+from settings import versionKey
+
+# bump when the manifest layout changes, an old manifest is rebuilt from the tool folders
+STORE_VERSION = 1
+
+# file name patterns of each tool inside its folder
+PATTERNS = {
+	'cli':'revanced-cli*.jar',
+	'patchesjar':'revanced-patches*.jar',
+	'patchesjson':'revanced-patches*.json',
+	'integrations':'revanced-integrations*.apk'
+}
+
+# toolPins keys, the patches jar and its json always go together
+PINS = {
+	'cli':('cli',),
+	'patches':('patchesjar','patchesjson'),
+	'integrations':('integrations',)
+}
+
+# the version in a file name like revanced-cli-4.6.0-all.jar or revanced-patches-4.7.0-dev.2.jar
+VERSION = re.compile(r'(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-(?!all\.)([0-9A-Za-z.-]+?))?(?:-all)?\.(?:jar|json|apk)$')
+
+def fileVersion(name):
+	m = VERSION.search(name)
+	if m is None:
+		return None
+	major, minor, patch, pre = m.groups()
+	version = '.'.join(x for x in (major,minor,patch) if x is not None)
+	return f'{version}-{pre}' if pre else version
+
+# every installed cli, patch bundle and integrations file with its version and checksum
+# the selected file of each tool is looked up in a dict, the folders are only listed again when they change
+class ToolStore:
+	def __init__(self,manifestFile:Path,folders:dict,pins=None):
+		self.manifestFile = Path(manifestFile)
+		self.folders = {x:Path(y) for x,y in folders.items()}
+		self.lock = threading.RLock()
+		self.pins = {}
+		for key, version in (pins or {}).items():
+			for kind in PINS.get(key,()):
+				if version: self.pins[kind] = str(version).lstrip('v')
+		self.load()
+
+	def load(self):
+		with self.lock:
+			self.tools = {x:{} for x in PATTERNS}
+			self.current = {x:None for x in PATTERNS}
+			self.stamps = {}
+			try:
+				data = json.loads(self.manifestFile.read_text(encoding='utf-8'))
+				if data.get('version') == STORE_VERSION:
+					self.tools |= data['tools']
+					self.stamps = data['stamps']
+			except (OSError,ValueError,KeyError):
+				pass
+			for kind in PATTERNS:
+				self.select(kind)
+			self.refresh()
+
+	def save(self):
+		with self.lock:
+			data = json.dumps({'version':STORE_VERSION,'tools':self.tools,'stamps':self.stamps},indent=1)
+		self.manifestFile.parent.mkdir(parents=True,exist_ok=True)
+		tmp = self.manifestFile.with_suffix('.tmp')
+		tmp.write_text(data,encoding='utf-8')
+		os.replace(tmp,self.manifestFile)
+
+	@staticmethod
+	def key(path):
+		return Path(path).absolute().as_posix()
+
+	# mtimes of the folder and every folder below it, scan finds tools in subfolders too
+	def _stamp(self,folder):
+		try:
+			stamp = [os.stat(folder).st_mtime_ns]
+		except OSError:
+			return None
+		for root, dirs, _ in os.walk(folder):
+			dirs.sort()
+			for name in dirs:
+				try:
+					stamp.append(os.stat(os.path.join(root,name)).st_mtime_ns)
+				except OSError:
+					pass
+		return stamp
+
+	# a folder is only listed again when one of its mtimes moved, i.e. a file was added, removed or renamed in it
+	# files already indexed with the same size and mtime are not hashed again
+	def refresh(self):
+		changed = False
+		with self.lock:
+			for kind, folder in self.folders.items():
+				stamp = self._stamp(folder)
+				if self.stamps.get(kind) == stamp and all(Path(x).exists() for x in self.tools[kind]):
+					continue
+				self.scan(kind)
+				self.stamps[kind] = stamp
+				changed = True
+		if changed:
+			self.save()
+
+	def scan(self,kind):
+		with self.lock:
+			found = {self.key(x):x for x in self.folders[kind].rglob(PATTERNS[kind]) if x.is_file()}
+			for key in [x for x in self.tools[kind] if x not in found]:
+				del self.tools[kind][key]
+			for key, path in found.items():
+				entry = self.tools[kind].get(key)
+				stat = path.stat()
+				if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+					self._register(kind,path)
+			self.select(kind)
+
+	def _register(self,kind,path,version=None):
+		stat = path.stat()
+		self.tools[kind][self.key(path)] = {
+			'version':version or fileVersion(path.name),
+			'sha256':fileHash(path),
+			'size':stat.st_size,
+			'mtime':stat.st_mtime_ns,
+			'installed':datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+		}
+
+	# a downloaded tool, registered with the version its release was tagged with
+	def add(self,kind,path,version=None):
+		with self.lock:
+			self._register(kind,Path(path),fileVersion(Path(path).name) or (version.lstrip('v') if version else None))
+			self.select(kind)
+		self.save()
+
+	# the pinned version when it is installed, otherwise the highest version
+	def select(self,kind):
+		with self.lock:
+			entries = self.tools[kind]
+			pin = self.pins.get(kind)
+			choice = None
+			if pin:
+				pinned = [x for x,y in entries.items() if versionKey(y['version']) == versionKey(pin)]
+				choice = max(pinned,key=lambda x: entries[x]['mtime']) if pinned else None
+			if choice is None and entries:
+				choice = max(entries,key=lambda x: (versionKey(entries[x]['version']),entries[x]['mtime']))
+			self.current[kind] = choice
+			return choice
+
+	def get(self,kind):
+		current = self.current.get(kind)
+		if current is None:
+			return None
+		return Path(current)
+
+	def entry(self,kind,path):
+		return self.tools[kind].get(self.key(path))
+
+	def versions(self,kind):
+		return sorted({x['version'] for x in self.tools[kind].values()},key=versionKey)
+
+	# true when the file still has the checksum it was installed with
+	def verify(self,kind,path):
+		entry = self.entry(kind,path)
+		return entry is not None and Path(path).exists() and fileHash(path) == entry['sha256']
+
+	# deletes all but the newest keep versions of every tool, the selected, pinned and protected files always stay
+	def gc(self,keep,protect=()):
+		if keep <= 0:
+			return []
+		protect = {self.key(x) for x in protect if x is not None}
+		removed = []
+		with self.lock:
+			for kind, entries in self.tools.items():
+				newest = sorted({x['version'] for x in entries.values()},key=versionKey,reverse=True)[:keep]
+				pin = self.pins.get(kind)
+				for key, entry in list(entries.items()):
+					if entry['version'] in newest or key == self.current[kind] or key in protect:
+						continue
+					if pin and versionKey(entry['version']) == versionKey(pin):
+						continue
+					try:
+						Path(key).unlink(missing_ok=True)
+					except OSError:
+						continue
+					del entries[key]
+					removed.append(Path(key))
+		if removed:
+			self.save()
+		return removed
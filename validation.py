@@ -1,5 +1,5 @@
 from pydantic import  Field, AliasPath, validator, BaseModel
-from typing import List, Optional,Annotated,Union,Dict
+from typing import Optional,Annotated,Union,Dict
 from pathlib import Path
 from settings import slugify
 class Option(BaseModel):
@@ -20,44 +20,12 @@ class Patch(BaseModel):
 	use:Optional[bool] = Field(default=None)
 	requiresIntegrations:Optional[bool] = Field(default=None)
 	options:Dict[str,Option]
-	versions:Optional[List[str]] = Field(default=None)
 	def getOptionsDict(self):
 		return {x.key:x for x in self.options}
 	@validator('options',pre=True)
 	def option_parse(cls,value):
 		return {x['key']:x for x in value}
 
-class App(BaseModel):
-	name:str
-	patches: Dict[str,Patch]
-	
-	@validator('patches',pre=True)
-	def patches_parse(cls,value):
-		return {x['name']:x for x in value}
-	def getLatest(self):
-		newst = []
-		for patch in self.patches.values():
-			if patch.versions:
-				newst += patch.versions
-		if len(newst) > 0:
-			return sorted(newst)[-1]
-			
-		return "Latest"
-
-	def getOptions(self):
-		defaults = []
-		for patch in self.patches.values():
-			if len(patch.options) > 0 :
-				tmp = {'patchName':patch.name}
-				tmp['options'] = []
-				for option in patch.options.values():
-					tmp['options'].append({
-						'key':option.key,
-						'value':option.value
-                    })
-				defaults.append(tmp)
-		return defaults
-
 class Apk(BaseModel):
 	path:Path
 	name:str
@@ -70,6 +38,11 @@ class Apk(BaseModel):
 			return self.path.with_suffix('.error')
 		return self.outputFile.with_suffix('.error')
 	@property
+	def patchLog(self):
+		if self.outputFolder is None:
+			return self.path.with_suffix('.log')
+		return self.outputFile.with_suffix('.log')
+	@property
 	def options(self):
 		return self.path.with_suffix('.json')
 	@property
@@ -86,4 +59,22 @@ class Apk(BaseModel):
 			if uniformapk != self.path and not uniformapk.exists():
 				self.path = self.path.rename(uniformapk)
 				return True
-		return False
\ No newline at end of file
+		return False
+
+class JobResult(BaseModel):
+	apkpath:Path
+	apk:Optional[Apk] = Field(default=None)
+	command:Optional[str] = Field(default=None)
+	# queued, planned, skipped, uptodate, duplicate, superseded, done or failed
+	status:str = Field(default='queued')
+	# the identical apk that is patched instead of this one
+	duplicateOf:Optional[Path] = Field(default=None)
+	# the newer version of the same package that is patched instead of this one
+	supersededBy:Optional[Path] = Field(default=None)
+	error:Optional[str] = Field(default=None)
+	elapsed:float = Field(default=0.0)
+	returncode:Optional[int] = Field(default=None)
+	# bytes, only where the os reports it
+	peakRss:Optional[int] = Field(default=None)
+	# phase and per patch timings read from revanced-cli's output, see cliprofile.py
+	profile:Optional[dict] = Field(default=None)